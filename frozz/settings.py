@@ -3,7 +3,9 @@ Django settings for frozz project.
 """
 
 from pathlib import Path
+import importlib.util
 import os
+import warnings
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -56,8 +58,15 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Plantillas compiladas una sola vez por proceso (PDFs incluidos); en DEBUG
+            # el autoreload de Django limpia este cache al editar una plantilla.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -135,6 +144,30 @@ else:
         }
     }
 
+# Cache: Redis si hay REDIS_URL (requiere el paquete redis); si no, memoria local del proceso.
+_redis_url = os.environ.get('REDIS_URL', '').strip()
+if _redis_url and importlib.util.find_spec('redis') is None:
+    # Sin el cliente instalado RedisCache falla en el primer acceso: mejor degradar a LocMem
+    warnings.warn('REDIS_URL está definido pero el paquete redis no está instalado; se usa LocMemCache.')
+    _redis_url = ''
+if _redis_url:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': _redis_url,
+        }
+    }
+    # Sesiones (carrito, cotización): lectura desde cache compartido, escritura también en BD
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+    # LocMem es por proceso: cachear sesiones dejaría copias viejas (logout, carrito) en otros workers
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -222,6 +255,10 @@ if _on_serverless:
 else:
     PDF_CACHE_ROOT = Path(os.environ.get('PDF_CACHE_ROOT', str(MEDIA_ROOT / 'quotations' / 'pdf_cache')))
 
+# Copia de los PDFs en el cache compartido (Redis) para que otras instancias no vuelvan a
+# generarlos; con LocMemCache no aporta sobre el cache en disco, así que se desactiva.
+PDF_BYTES_CACHE_TIMEOUT = 60 * 60 * 24 if _redis_url and not DEBUG else 0
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -252,3 +289,10 @@ REST_FRAMEWORK = {
 # Telegram integration (alerts)
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', '')
 TELEGRAM_CHAT_ID = os.environ.get('TELEGRAM_CHAT_ID', '')
+
+# Enviar avisos (Telegram) en un hilo aparte para no bloquear la respuesta del checkout.
+# En serverless el proceso se congela al responder, así que por defecto allí se envían en línea.
+_background_notifications = os.environ.get('BACKGROUND_NOTIFICATIONS', '').strip().lower()
+BACKGROUND_NOTIFICATIONS = (
+    _background_notifications in ('1', 'true', 'yes') if _background_notifications else not _on_serverless
+)
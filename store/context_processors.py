@@ -1,10 +1,17 @@
-from .models import Cart, Category, SiteSettings, SidebarBanner, PromoBanner
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .models import Cart, CartItem, Category, SiteSettings, SidebarBanner, PromoBanner
 
 
 def cart(request):
     """Add cart to context"""
     if request.user.is_authenticated:
         cart_obj, created = Cart.objects.get_or_create(user=request.user)
+        # Ítems + producto en una consulta; item_count, total y el offcanvas reutilizan la cache
+        prefetch_related_objects(
+            [cart_obj],
+            Prefetch('items', queryset=CartItem.objects.select_related('product')),
+        )
         return {
             'cart': cart_obj,
             'cart_item_count': cart_obj.item_count,
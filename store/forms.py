@@ -404,6 +404,33 @@ class ProductImageForm(forms.ModelForm):
         }
 
 
+class MultipleImageInput(forms.ClearableFileInput):
+    """Input de archivo que permite seleccionar varias imágenes a la vez"""
+    allow_multiple_selected = True
+
+
+class MultipleImageField(forms.ImageField):
+    """ImageField que valida y devuelve una lista de imágenes"""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', MultipleImageInput(attrs={'class': 'form-control', 'accept': 'image/*'}))
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            # Una lista vacía no pasa por la validación de cada archivo: exigir al menos uno aquí
+            if not data and self.required:
+                raise forms.ValidationError(self.error_messages['required'], code='required')
+            return [single_clean(d, initial) for d in data]
+        return [single_clean(data, initial)]
+
+
+class BulkImageUploadForm(forms.Form):
+    """Form for uploading several product / variation images in one request"""
+    images = MultipleImageField(label='Imágenes')
+
+
 class ProductVariationForm(forms.ModelForm):
     """Form for product variations"""
     
@@ -561,6 +588,13 @@ class QuotationForm(forms.Form):
         widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 4, 'placeholder': 'Información adicional sobre la cotización...'})
     )
 
+    def __init__(self, *args, **kwargs):
+        from .signals import quotation_client_choices
+        super().__init__(*args, **kwargs)
+        # Opciones del selector desde cache (la validación sigue usando el queryset)
+        field = self.fields['existing_client']
+        field.choices = [('', field.empty_label)] + quotation_client_choices()
+
 
 class DilutionBaseProductForm(forms.ModelForm):
     """Formulario admin para productos base de la calculadora de agua."""
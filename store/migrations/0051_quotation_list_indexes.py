@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-15 22:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0050_quotation_payment_history'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='quotation',
+            index=models.Index(fields=['-created_at'], name='quotation_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quotation',
+            index=models.Index(fields=['order_status', '-created_at'], name='quotation_status_created_idx'),
+        ),
+    ]
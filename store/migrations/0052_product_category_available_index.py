@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-15 22:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0051_quotation_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'available'], name='product_category_avail_idx'),
+        ),
+    ]
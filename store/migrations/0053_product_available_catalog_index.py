@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-15 22:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0052_product_category_available_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['available', 'category', 'name'], name='product_avail_cat_name_idx'),
+        ),
+    ]
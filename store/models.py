@@ -29,6 +29,14 @@ class Category(models.Model):
         super().save(*args, **kwargs)
 
 
+class ProductQuerySet(models.QuerySet):
+    """Consultas reutilizables de productos"""
+
+    def available_catalog(self):
+        """Productos disponibles con su categoría, ordenados por categoría y nombre"""
+        return self.filter(available=True).select_related('category').order_by('category__name', 'name')
+
+
 class Product(models.Model):
     """Products for sale or rental."""
     PRODUCT_TYPE_CHOICES = [
@@ -160,10 +168,16 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Producto'
         verbose_name_plural = 'Productos'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['category', 'available'], name='product_category_avail_idx'),
+            models.Index(fields=['available', 'category', 'name'], name='product_avail_cat_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -916,6 +930,10 @@ class Quotation(models.Model):
         verbose_name = 'Cotización'
         verbose_name_plural = 'Cotizaciones'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='quotation_created_idx'),
+            models.Index(fields=['order_status', '-created_at'], name='quotation_status_created_idx'),
+        ]
 
     def __str__(self):
         return f'Cotización #{self.id}'
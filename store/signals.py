@@ -0,0 +1,61 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Product, Category, ProductRentalPrice
+
+CATALOG_CACHE_VERSION_KEY = 'catalog:version'
+QUOTATION_CLIENT_CHOICES_KEY = 'quotation:client_choices'
+
+
+def catalog_cache_version() -> int:
+    """Versión actual del catálogo cacheado (cambia al editar productos, categorías o tarifas)."""
+    return cache.get_or_set(CATALOG_CACHE_VERSION_KEY, 1, None)
+
+
+def bump_catalog_cache_version():
+    """Invalida las agrupaciones de catálogo cacheadas pasando a una nueva versión de clave."""
+    try:
+        cache.incr(CATALOG_CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_CACHE_VERSION_KEY, 2, None)
+
+
+def bump_catalog_cache_version_on_commit():
+    """
+    Invalida el catálogo cuando la transacción en curso se confirma: si se
+    invalidara antes, otra petición podría recachear los datos previos al commit.
+    """
+    transaction.on_commit(bump_catalog_cache_version)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=ProductRentalPrice)
+@receiver(post_delete, sender=ProductRentalPrice)
+def invalidate_catalog_cache(sender, **kwargs):
+    """Cualquier cambio de catálogo invalida la agrupación por categoría de la cotización."""
+    bump_catalog_cache_version_on_commit()
+
+
+def quotation_client_choices() -> list:
+    """[(id, etiqueta)] de clientes (no staff) para el selector de la cotización, cacheado."""
+    return cache.get_or_set(
+        QUOTATION_CLIENT_CHOICES_KEY,
+        lambda: list(
+            User.objects.filter(is_staff=False)
+            .order_by('first_name', 'last_name', 'username')
+            .values_list('id', 'username')
+        ),
+        300,
+    )
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_quotation_client_choices(sender, **kwargs):
+    """Altas, bajas o cambios de usuarios refrescan el selector de clientes."""
+    cache.delete(QUOTATION_CLIENT_CHOICES_KEY)
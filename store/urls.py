@@ -89,6 +89,7 @@ urlpatterns = [
     
     # Product images
     path('inventory/products/<int:product_id>/add-image/', views.inventory_add_image, name='inventory_add_image'),
+    path('inventory/products/<int:product_id>/add-images/', views.inventory_bulk_add_images, name='inventory_bulk_add_images'),
     path('inventory/products/<int:product_id>/delete-image/<int:image_id>/', views.inventory_delete_image, name='inventory_delete_image'),
     
     # Product variations
@@ -98,6 +99,7 @@ urlpatterns = [
     
     # Variation images
     path('inventory/products/<int:product_id>/variation/<int:variation_id>/add-image/', views.inventory_add_variation_image, name='inventory_add_variation_image'),
+    path('inventory/products/<int:product_id>/variation/<int:variation_id>/add-images/', views.inventory_bulk_add_variation_images, name='inventory_bulk_add_variation_images'),
     path('inventory/products/<int:product_id>/variation/<int:variation_id>/delete-image/<int:image_id>/', views.inventory_delete_variation_image, name='inventory_delete_variation_image'),
     
     # Technical specs
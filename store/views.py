@@ -1,27 +1,47 @@
 import os
 import logging
 import json
+import hashlib
+import tempfile
 from datetime import timedelta
+from io import BytesIO
+from urllib.parse import unquote, urlparse
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.template.loader import get_template
 
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
 from django.utils.text import slugify
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.contrib import messages
 import base64
 import re
+import secrets
+import threading
+from functools import lru_cache
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login as auth_login
 from django.views.decorators.clickjacking import xframe_options_sameorigin
-from django.http import JsonResponse, HttpResponse
-from django.db.models import Q, Count, Min, Max, Sum, Prefetch
+from django.http import JsonResponse, HttpResponse, FileResponse
+from django.db import connection, transaction
+from django.db.models import (
+    Q, Count, Min, Max, Sum, Prefetch, F, Case, When, Value, IntegerField, DecimalField,
+    ExpressionWrapper, Exists, OuterRef,
+)
+from django.db.models.functions import Greatest
+from django.core.cache import cache
 from django.core.paginator import Paginator
 from django.core.files.base import ContentFile
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_email
 from decimal import Decimal
+import requests
+from requests.adapters import HTTPAdapter
 
 from .models import (
     Product, Category, Cart, CartItem, Order, OrderItem,
@@ -36,6 +56,7 @@ from .models import (
 from .forms import (
     ProductForm,
     ProductImageForm,
+    BulkImageUploadForm,
     ProductVariationForm,
     ProductVariationImageForm,
     ProductTechnicalSpecForm,
@@ -49,45 +70,103 @@ from .forms import (
     DrinzzContractConfigForm,
 )
 from .models import Quotation, QuotationItem
+from .signals import catalog_cache_version, bump_catalog_cache_version_on_commit
 
 # IVA en Colombia (por defecto 19%). Los precios ya incluyen IVA en este proyecto.
 IVA_RATE = Decimal('0.19')
+# Divisor para separar la base de un precio con IVA incluido
+_IVA_DIVISOR = Decimal('1.00') + IVA_RATE
+_ZERO = Decimal('0.00')
+
+
+def _split_iva(amount: Decimal):
+    """(base, iva) de un monto con IVA incluido."""
+    if amount is None:
+        amount = _ZERO
+    base = amount / _IVA_DIVISOR
+    return base, amount - base
 
 logger = logging.getLogger(__name__)
 
+# Letras y dígitos sin caracteres confusos (o, O, 0, l, I) para contraseñas generadas
+_CLIENT_PASSWORD_ALPHABET = 'abcdefghijkmnpqrstuvwxyzABCDEFGHJKLMNPQRSTUVWXYZ123456789'
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator que evita repetir el COUNT(*) del listado.
+    Si la vista ya conoce el total (p. ej. de un aggregate) se pasa en known_count; si no, se
+    cachea unos segundos bajo cache_key, que debe incluir la versión de catálogo y los filtros.
+    """
+
+    def __init__(self, object_list, per_page, *, cache_key: str = None, known_count: int = None,
+                 cache_timeout: int = 60, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.cache_key = cache_key
+        self.known_count = known_count
+        self.cache_timeout = cache_timeout
+
+    @cached_property
+    def count(self):
+        if self.known_count is not None:
+            return self.known_count
+        if not self.cache_key:
+            return super().count
+        return cache.get_or_set(
+            self.cache_key,
+            lambda: super(CachedCountPaginator, self).count,
+            self.cache_timeout,
+        )
+
+
+def _inventory_count_cache_key(request, name: str, page_param: str = 'page') -> str:
+    """Clave del conteo cacheado: versión de catálogo + filtros del GET (sin el número de página)."""
+    params = request.GET.copy()
+    params.pop(page_param, None)
+    filters = hashlib.sha1(params.urlencode().encode()).hexdigest()[:12] if params else 'all'
+    return f'inventory:count:{name}:v{catalog_cache_version()}:{filters}'
+
+
+# Conjuntos de estados inmutables: se resuelven una vez al cargar el módulo
+_STOCK_COMMIT_STATUSES = frozenset({
+    'aceptado',
+    'esperando_pago',
+    'pago_parcial',
+    'pago_recibido',
+    'enviado',
+    'recibido',
+    'modificado_y_enviado',
+})
+_POST_PAYMENT_STATUSES = frozenset({
+    'pago_parcial',
+    'pago_recibido',
+    'enviado',
+    'recibido',
+    'modificado_y_enviado',
+})
+_FULLY_PAID_STATUSES = frozenset({
+    'pago_recibido',
+    'enviado',
+    'recibido',
+    'modificado_y_enviado',
+})
+_ALLOWED_QUOTATION_STATUSES = frozenset(c[0] for c in Quotation.QUOTATION_STATUS_CHOICES)
+_ALLOWED_ORDER_STATUSES = frozenset(c[0] for c in Quotation.ORDER_STATUS_CHOICES)
+
 
 def _stock_commit_statuses():
     """Estados de pedido que comprometen inventario (descuentan stock una sola vez)."""
-    return {
-        'aceptado',
-        'esperando_pago',
-        'pago_parcial',
-        'pago_recibido',
-        'enviado',
-        'recibido',
-        'modificado_y_enviado',
-    }
+    return _STOCK_COMMIT_STATUSES
 
 
 def _post_payment_statuses():
     """Estados que implican comprobante / pago (o posteriores)."""
-    return {
-        'pago_parcial',
-        'pago_recibido',
-        'enviado',
-        'recibido',
-        'modificado_y_enviado',
-    }
+    return _POST_PAYMENT_STATUSES
 
 
 def _fully_paid_statuses():
     """Estados con pago total (cotización cerrada / factura disponible)."""
-    return {
-        'pago_recibido',
-        'enviado',
-        'recibido',
-        'modificado_y_enviado',
-    }
+    return _FULLY_PAID_STATUSES
 
 
 def _close_quotation_on_full_payment(quote: Quotation) -> bool:
@@ -114,6 +193,31 @@ def _quotation_can_edit(quote: Quotation) -> bool:
     return True
 
 
+def _stock_deltas_for_quotation(quotation: Quotation) -> dict:
+    """{product_id: cantidad} de las líneas de venta (sin alquiler); suma líneas repetidas."""
+    deltas = {}
+    for product_id, qty in (
+        quotation.items.filter(product__isnull=False)
+        .exclude(product__product_type='rental')
+        .values_list('product_id', 'quantity')
+    ):
+        try:
+            qty = int(qty or 0)
+        except (TypeError, ValueError):
+            qty = 0
+        if qty > 0:
+            deltas[product_id] = deltas.get(product_id, 0) + qty
+    return deltas
+
+
+def _stock_delta_case(deltas: dict, *, sign: int):
+    """Expresión CASE para aplicar todos los deltas de stock en un solo UPDATE con F()."""
+    return Case(
+        *[When(id=product_id, then=F('stock') + sign * qty) for product_id, qty in deltas.items()],
+        output_field=IntegerField(),
+    )
+
+
 def _restore_stock_for_quotation(quotation: Quotation) -> bool:
     """
     Devuelve al inventario el stock previamente descontado de una cotización.
@@ -122,26 +226,15 @@ def _restore_stock_for_quotation(quotation: Quotation) -> bool:
     if not getattr(quotation, 'stock_deducted', False):
         return False
 
-    items = quotation.items.select_related('product')
+    deltas = _stock_deltas_for_quotation(quotation)
     changed_any = False
-    for it in items:
-        product = it.product
-        if not product:
-            continue
-        if getattr(product, 'is_rental', False) or getattr(product, 'product_type', '') == 'rental':
-            continue
-        try:
-            qty = int(it.quantity or 0)
-        except (TypeError, ValueError):
-            qty = 0
-        if qty <= 0:
-            continue
-        current_stock = int(product.stock or 0)
-        new_stock = current_stock + qty
-        if new_stock != current_stock:
-            product.stock = new_stock
-            product.save(update_fields=['stock'])
-            changed_any = True
+    if deltas:
+        changed_any = bool(
+            Product.objects.filter(id__in=deltas.keys())
+            .update(stock=_stock_delta_case(deltas, sign=1))
+        )
+        # update() no emite post_save: invalidar el catálogo cacheado explícitamente
+        bump_catalog_cache_version_on_commit()
 
     quotation.stock_deducted = False
     quotation.save(update_fields=['stock_deducted', 'updated_at'])
@@ -209,29 +302,16 @@ def _deduct_stock_for_quotation(quotation: Quotation):
     if getattr(quotation, 'stock_deducted', False):
         return False
 
-    items = quotation.items.select_related('product')
+    deltas = _stock_deltas_for_quotation(quotation)
     changed_any = False
-    for it in items:
-        product = it.product
-        if not product:
-            continue
-        # Alquiler no reduce stock de inventario de venta
-        if getattr(product, 'is_rental', False) or getattr(product, 'product_type', '') == 'rental':
-            continue
-        try:
-            qty = int(it.quantity or 0)
-        except (TypeError, ValueError):
-            qty = 0
-        if qty <= 0:
-            continue
-        current_stock = int(product.stock or 0)
-        new_stock = current_stock - qty
-        if new_stock < 0:
-            new_stock = 0
-        if new_stock != current_stock:
-            product.stock = new_stock
-            product.save(update_fields=['stock'])
-            changed_any = True
+    if deltas:
+        # Un solo UPDATE atómico: stock = max(stock - cantidad, 0) por producto
+        changed_any = bool(
+            Product.objects.filter(id__in=deltas.keys(), stock__gt=0)
+            .update(stock=Greatest(_stock_delta_case(deltas, sign=-1), Value(0)))
+        )
+        # update() no emite post_save: invalidar el catálogo cacheado explícitamente
+        bump_catalog_cache_version_on_commit()
 
     quotation.stock_deducted = True
     quotation.save(update_fields=['stock_deducted', 'updated_at'])
@@ -240,11 +320,12 @@ def _deduct_stock_for_quotation(quotation: Quotation):
 
 def _ensure_stock_deducted_for_committed_quotations():
     """Sincroniza stock pendiente de cotizaciones ya aceptadas/pagadas sin descuento."""
+    # El descuento lee sus propias líneas; aquí basta recorrer las cotizaciones por bloques
     pending = Quotation.objects.filter(
         stock_deducted=False,
         order_status__in=_stock_commit_statuses(),
-    ).prefetch_related('items__product')
-    for quote in pending:
+    ).only('id', 'stock_deducted').order_by('id')
+    for quote in pending.iterator(chunk_size=500):
         _deduct_stock_for_quotation(quote)
 
 
@@ -606,38 +687,89 @@ def product_detail(request, slug):
     return render(request, 'store/product_detail.html', context)
 
 
+class _SessionCartItem:
+    """Ítem de carrito de sesión con la misma interfaz que CartItem para las plantillas."""
+
+    def __init__(self, product, quantity):
+        self.product = product
+        self.quantity = quantity
+        self.id = product.id
+
+    @property
+    def subtotal(self):
+        return self.product.selling_price * self.quantity
+
+
+def _parse_session_cart(session_cart: dict) -> list:
+    """Convierte el carrito de sesión {'pid': qty} en pares (pid, qty) válidos, en un solo recorrido."""
+    parsed = []
+    for pid_str, qty in session_cart.items():
+        try:
+            pid = int(pid_str)
+            q = int(qty)
+        except (TypeError, ValueError):
+            continue
+        if q > 0:
+            parsed.append((pid, q))
+    return parsed
+
+
+def _cart_stock_shortfalls(cart_items) -> list:
+    """
+    Nombres de productos del carrito no disponibles o con cantidad mayor al stock.
+    Los de alquiler no se validan: su inventario no se descuenta al comprometer el pedido.
+    El stock se descuenta al aceptar la cotización, así que esto es una validación, no una reserva.
+    """
+    return [
+        item.product.name
+        for item in cart_items
+        if not item.product.available
+        or (item.product.product_type != 'rental' and item.quantity > item.product.stock)
+    ]
+
+
+def _hydrate_session_cart(session_cart: dict):
+    """
+    Resuelve el carrito de sesión en una sola consulta.
+    Devuelve (cart_items, cart_total, ids, products) para reutilizar en GET y POST.
+    """
+    cart_items = []
+    cart_total = Decimal('0.00')
+    parsed = _parse_session_cart(session_cart)
+    ids = [pid for pid, _ in parsed]
+    # Solo las columnas que usan el resumen y la cotización (selling_price depende de price/promotional_price)
+    products = (
+        Product.objects
+        .filter(id__in=ids, available=True)
+        .only('id', 'name', 'slug', 'price', 'promotional_price', 'image', 'stock', 'available', 'product_type')
+        .in_bulk()
+    )
+
+    for pid, q in parsed:
+        product = products.get(pid)
+        if not product:
+            continue
+        item = _SessionCartItem(product, q)
+        cart_items.append(item)
+        cart_total += item.subtotal
+    return cart_items, cart_total, ids, products
+
+
 def cart(request):
     """Shopping cart page"""
     if request.user.is_authenticated:
         cart_obj, created = Cart.objects.get_or_create(user=request.user)
-        cart_items = cart_obj.items.all()
-        cart_total = cart_obj.total
-        cart_item_count = cart_obj.item_count
+        # Producto en el mismo JOIN: la plantilla lee nombre, imagen y precios de cada ítem
+        cart_items = list(cart_obj.items.select_related('product'))
+        cart_total = sum((item.subtotal for item in cart_items), Decimal('0.00'))
+        cart_item_count = sum(item.quantity for item in cart_items)
     else:
         # Handle anonymous user cart from session
-        from decimal import Decimal
-        cart_items = []
-        cart_total = Decimal('0.00')
         session_cart = request.session.get('cart', {})
-        for product_id_str, quantity in session_cart.items():
-            try:
-                product = Product.objects.get(id=int(product_id_str), available=True)
-                # Create a temporary cart item-like object
-                class TempCartItem:
-                    def __init__(self, product, quantity):
-                        self.product = product
-                        self.quantity = quantity
-                        self.id = product.id
-                    
-                    @property
-                    def subtotal(self):
-                        return self.product.selling_price * self.quantity
-                
-                item = TempCartItem(product, quantity)
-                cart_items.append(item)
-                cart_total += item.subtotal
-            except (Product.DoesNotExist, ValueError):
-                continue
+        if isinstance(session_cart, dict):
+            cart_items, cart_total, _, _ = _hydrate_session_cart(session_cart)
+        else:
+            cart_items, cart_total = [], Decimal('0.00')
         cart_item_count = sum(session_cart.values()) if isinstance(session_cart, dict) else 0
     
     context = {
@@ -942,7 +1074,7 @@ def checkout(request):
         return redirect('accounts:login')
 
     cart_obj, created = Cart.objects.get_or_create(user=request.user)
-    cart_items = list(cart_obj.items.all())
+    cart_items = list(cart_obj.items.select_related('product'))
 
     if not cart_items:
         messages.warning(request, 'Tu carrito está vacío')
@@ -958,8 +1090,6 @@ def checkout(request):
 
     # Si el usuario confirma el pedido, generar una cotización como en guest_checkout
     if request.method == 'POST':
-        from decimal import Decimal
-
         # Si el usuario eligió una dirección guardada, tomamos los datos desde ahí
         saved_address_id = (request.POST.get('saved_address') or '').strip()
         departamento = city = address = ref = maps_url = phone = ''
@@ -1002,11 +1132,18 @@ def checkout(request):
             if not phone:
                 missing.append('Teléfono')
 
+        out_of_stock = _cart_stock_shortfalls(cart_items)
         if missing:
             messages.error(
                 request,
                 'Por favor completa los siguientes campos obligatorios: ' + ', '.join(missing)
             )
+        elif out_of_stock:
+            messages.error(
+                request,
+                'No hay suficiente stock para: ' + ', '.join(out_of_stock) + '. Ajusta tu carrito.'
+            )
+            return redirect('store:cart')
         else:
             extra_notes_parts = [address]
             if ref:
@@ -1055,15 +1192,16 @@ def checkout(request):
             quotation_obj.total = running_total
             quotation_obj.save(update_fields=['total', 'updated_at'])
 
-            # Vaciar carrito del usuario
-            cart_obj.items.all().delete()
+            # Vaciar carrito del usuario. CartItem no tiene señales ni FKs entrantes,
+            # así que Django lo resuelve con un único DELETE ... WHERE cart_id = ?
+            CartItem.objects.filter(cart=cart_obj).delete()
 
             # Enviar aviso a Telegram como pedido de cliente registrado
             logger.info(
                 "[CHECKOUT] Enviando notificación a Telegram para cotización %s (cliente registrado)",
                 quotation_obj.id,
             )
-            _notify_telegram_new_quotation(quotation_obj, is_registered=True)
+            _enqueue_telegram_new_quotation(quotation_obj.id, is_registered=True)
             _notify_wa_new_quotation(quotation_obj, source='Checkout cliente registrado', request=request)
 
             # Mostrar la misma página de "pasarela deshabilitada" / pedido registrado
@@ -1075,7 +1213,7 @@ def checkout(request):
     from accounts.forms import DEPARTAMENTOS_COLOMBIA
     context = {
         'cart_items': cart_items,
-        'cart_total': cart_obj.total,
+        'cart_total': sum((item.subtotal for item in cart_items), Decimal('0.00')),
         'default_address': default_address,
         'addresses': addresses,
         'departamentos': [c for c in DEPARTAMENTOS_COLOMBIA if c[0]],
@@ -1097,38 +1235,7 @@ def guest_checkout(request):
         messages.warning(request, 'Tu carrito está vacío')
         return redirect('store:cart')
 
-    cart_items = []
-    cart_total = Decimal('0.00')
-    ids = []
-    for pid_str in session_cart.keys():
-        try:
-            ids.append(int(pid_str))
-        except (TypeError, ValueError):
-            continue
-    products = Product.objects.filter(id__in=ids, available=True).in_bulk()
-
-    class TempCartItem:
-        def __init__(self, product, quantity):
-            self.product = product
-            self.quantity = quantity
-            self.id = product.id
-
-        @property
-        def subtotal(self):
-            return self.product.selling_price * self.quantity
-
-    for pid_str, qty in session_cart.items():
-        try:
-            pid = int(pid_str)
-            q = int(qty)
-        except (TypeError, ValueError):
-            continue
-        product = products.get(pid)
-        if not product or q <= 0:
-            continue
-        item = TempCartItem(product, q)
-        cart_items.append(item)
-        cart_total += item.subtotal
+    cart_items, cart_total, ids, products = _hydrate_session_cart(session_cart)
 
     if not cart_items:
         messages.warning(request, 'Tu carrito está vacío')
@@ -1157,33 +1264,42 @@ def guest_checkout(request):
                 extra_notes_parts.append(f"Ubicación (mapa): {maps_url}")
             notes = " | ".join(extra_notes_parts)
 
-            quotation_obj = Quotation.objects.create(
-                created_by=None,
-                existing_client=None,
-                client_kind=client_type or 'natural',
-                client_name=full_name,
-                client_email=email,
-                client_phone=phone,
-                client_departamento=departamento,
-                client_city=city,
-                notes=notes,
-                total=Decimal('0.00'),
-            )
-
-            running_total = Decimal('0.00')
-            for item in cart_items:
-                price = item.product.selling_price
-                qitem = QuotationItem.objects.create(
-                    quotation=quotation_obj,
-                    product=item.product,
-                    quantity=item.quantity,
-                    unit_price=price,
-                    subtotal=price * item.quantity,
+            out_of_stock = _cart_stock_shortfalls(cart_items)
+            if out_of_stock:
+                messages.error(
+                    request,
+                    'No hay suficiente stock para: ' + ', '.join(out_of_stock) + '. Ajusta tu carrito.'
                 )
-                running_total += qitem.subtotal
+                return redirect('store:cart')
 
-            quotation_obj.total = running_total
-            quotation_obj.save(update_fields=['total', 'updated_at'])
+            # Cotización e ítems se crean juntos o no se crean
+            with transaction.atomic():
+                running_total = sum(
+                    (item.product.selling_price * item.quantity for item in cart_items),
+                    Decimal('0.00'),
+                )
+                quotation_obj = Quotation.objects.create(
+                    created_by=None,
+                    existing_client=None,
+                    client_kind=client_type or 'natural',
+                    client_name=full_name,
+                    client_email=email,
+                    client_phone=phone,
+                    client_departamento=departamento,
+                    client_city=city,
+                    notes=notes,
+                    total=running_total,
+                )
+                QuotationItem.objects.bulk_create([
+                    QuotationItem(
+                        quotation=quotation_obj,
+                        product=item.product,
+                        quantity=item.quantity,
+                        unit_price=item.product.selling_price,
+                        subtotal=item.product.selling_price * item.quantity,
+                    )
+                    for item in cart_items
+                ])
 
             # Limpiar carrito de sesión
             request.session['cart'] = {}
@@ -1194,7 +1310,7 @@ def guest_checkout(request):
                 "[GUEST_CHECKOUT] Enviando notificación a Telegram para cotización %s (cliente invitado)",
                 quotation_obj.id,
             )
-            _notify_telegram_new_quotation(quotation_obj, is_registered=False)
+            _enqueue_telegram_new_quotation(quotation_obj.id, is_registered=False)
             _notify_wa_new_quotation(quotation_obj, source='Checkout invitado / cliente', request=request)
 
             return render(request, 'store/guest_checkout_success.html', {
@@ -1236,33 +1352,31 @@ def guest_checkout_login(request):
     if isinstance(session_cart, dict) and session_cart:
         cart_obj, _ = Cart.objects.get_or_create(user=user)
         # Cargar productos válidos
-        ids = []
-        for pid_str in session_cart.keys():
-            try:
-                ids.append(int(pid_str))
-            except (TypeError, ValueError):
-                continue
-        products = Product.objects.filter(id__in=ids, available=True).in_bulk()
+        parsed = _parse_session_cart(session_cart)
+        valid_ids = set(
+            Product.objects
+            .filter(id__in=[pid for pid, _ in parsed], available=True)
+            .values_list('id', flat=True)
+        )
 
-        for pid_str, qty in session_cart.items():
-            try:
-                pid = int(pid_str)
-                q = int(qty)
-            except (TypeError, ValueError):
-                continue
-            if q <= 0:
-                continue
-            product = products.get(pid)
-            if not product:
-                continue
-            item, created = CartItem.objects.get_or_create(
-                cart=cart_obj,
-                product=product,
-                defaults={'quantity': q},
+        # Sumar cantidades de sesión a las ya guardadas y escribir todo en un solo UPSERT
+        merged = dict(
+            CartItem.objects
+            .filter(cart=cart_obj, product_id__in=valid_ids)
+            .values_list('product_id', 'quantity')
+        )
+        for pid, q in parsed:
+            if pid in valid_ids:
+                merged[pid] = merged.get(pid, 0) + q
+
+        if merged:
+            CartItem.objects.bulk_create(
+                [CartItem(cart=cart_obj, product_id=pid, quantity=q) for pid, q in merged.items()],
+                update_conflicts=True,
+                unique_fields=['cart', 'product'],
+                update_fields=['quantity', 'updated_at'],
+                batch_size=500,
             )
-            if not created:
-                item.quantity += q
-                item.save()
 
     # Hacemos login (rota la sesión pero ya tenemos el carrito en DB)
     auth_login(request, user)
@@ -1283,14 +1397,14 @@ def order_list(request):
     orders = (
         Order.objects
         .filter(user=request.user, status__in=['paid', 'preparing', 'shipped', 'delivered'])
-        .prefetch_related('items__product')
+        .prefetch_related(Prefetch('items', queryset=OrderItem.objects.select_related('product')))
         .order_by('-created_at')
     )
 
     quotations = (
         Quotation.objects
         .filter(existing_client=request.user)
-        .prefetch_related('items__product')
+        .prefetch_related(Prefetch('items', queryset=QuotationItem.objects.select_related('product')))
         .order_by('-created_at')
     )
 
@@ -1301,22 +1415,14 @@ def order_list(request):
         .order_by('-created_at')
     )
 
-    # Top productos más comprados por este usuario
-    top_products = []
+    # Top productos más comprados por este usuario (agregado + producto en una sola consulta)
     top = (
-        OrderItem.objects
-        .filter(order__user=request.user)
-        .values('product_id')
-        .annotate(total_qty=Sum('quantity'))
+        Product.objects
+        .filter(available=True, orderitem__order__user=request.user)
+        .annotate(total_qty=Sum('orderitem__quantity'))
         .order_by('-total_qty')[:8]
     )
-    top_ids = [row['product_id'] for row in top]
-    products_by_id = Product.objects.filter(id__in=top_ids, available=True).in_bulk()
-    for row in top:
-        p = products_by_id.get(row['product_id'])
-        if not p:
-            continue
-        top_products.append({'product': p, 'qty': row['total_qty']})
+    top_products = [{'product': p, 'qty': p.total_qty} for p in top]
 
     context = {
         'orders': orders,
@@ -1375,7 +1481,16 @@ def normatividad(request):
 def client_list(request):
     """List all clients (non-staff users) with filters by search, type, email and phone."""
     from accounts.models import UserProfile
-    clients = User.objects.filter(is_staff=False).select_related('profile').order_by('-date_joined')
+    clients = (
+        User.objects
+        .filter(is_staff=False)
+        .select_related('profile')
+        .only(
+            'id', 'username', 'first_name', 'last_name', 'email', 'date_joined',
+            'profile__phone', 'profile__client_type', 'profile__address',
+        )
+        .order_by('-date_joined')
+    )
     # Filtro por búsqueda (usuario, nombre, apellido)
     search = (request.GET.get('q') or '').strip()
     if search:
@@ -1447,29 +1562,32 @@ def client_detail(request, client_id):
     """View client details. Pass new_password if just created (from session, shown once)."""
     from .models import Quotation
     from decimal import Decimal
-    client = get_object_or_404(User, id=client_id, is_staff=False)
+    client = get_object_or_404(User.objects.select_related('profile'), id=client_id, is_staff=False)
     new_password = request.session.pop('new_client_password', None)
     # Cotizaciones del cliente (como existing_client)
+    inactive_statuses = ['vencida', 'cancelada']
     quotations = Quotation.objects.filter(existing_client=client).order_by('-created_at')
-    quotations_active = quotations.exclude(quotation_status__in=['vencida', 'cancelada'])
-    total_quotations = quotations.count()
-    active_count = quotations_active.count()
-    total_quoted = quotations.aggregate(s=Sum('total'))['s'] or Decimal('0')
+    quotations_active = quotations.exclude(quotation_status__in=inactive_statuses)
+    # Conteos y sumas en una sola consulta por relación
+    q_stats = quotations.aggregate(
+        count=Count('id'),
+        active=Count('id', filter=~Q(quotation_status__in=inactive_statuses)),
+        total_quoted=Sum('total'),
+    )
     # Pedidos del cliente
     orders = client.orders.all().order_by('-created_at')
-    total_orders = orders.count()
-    total_ordered = orders.aggregate(s=Sum('total'))['s'] or Decimal('0')
+    o_stats = orders.aggregate(count=Count('id'), total_ordered=Sum('total'))
     context = {
         'client': client,
         'new_password': new_password,
         'quotations_active': quotations_active[:10],
         'quotations': quotations,
-        'total_quotations': total_quotations,
-        'active_quotations_count': active_count,
-        'total_quoted': total_quoted,
+        'total_quotations': q_stats['count'],
+        'active_quotations_count': q_stats['active'],
+        'total_quoted': q_stats['total_quoted'] or Decimal('0'),
         'orders': orders[:10],
-        'total_orders': total_orders,
-        'total_ordered': total_ordered,
+        'total_orders': o_stats['count'],
+        'total_ordered': o_stats['total_ordered'] or Decimal('0'),
     }
     return render(request, 'store/manager/client_detail.html', context)
 
@@ -1538,16 +1656,13 @@ def client_delete(request, client_id):
 @staff_member_required
 def client_generate_password(request, client_id):
     """Generate a new random password for the client. POST only. Returns JSON."""
-    import random
-    import string
     if request.method != 'POST':
         return JsonResponse({'error': 'Método no permitido'}, status=405)
     client = get_object_or_404(User, id=client_id, is_staff=False)
-    chars = string.ascii_letters + string.digits
-    chars = chars.replace('o', '').replace('O', '').replace('0', '').replace('l', '').replace('I', '')
-    pwd = ''.join(random.choice(chars) for _ in range(12))
-    client.set_password(pwd)
-    client.save()
+    pwd = ''.join(secrets.choice(_CLIENT_PASSWORD_ALPHABET) for _ in range(12))
+    with transaction.atomic():
+        client.set_password(pwd)
+        client.save(update_fields=['password'])
     return JsonResponse({'password': pwd})
 
 
@@ -1737,16 +1852,20 @@ def inventory_dashboard(request):
     _ensure_stock_deducted_for_committed_quotations()
 
     # Normalizar tipos legacy (insumo/desechable) a venta
-    Product.objects.filter(product_type__in=('supply', 'disposable')).update(product_type='sale')
+    if Product.objects.filter(product_type__in=('supply', 'disposable')).update(product_type='sale'):
+        bump_catalog_cache_version_on_commit()
 
     sale_qs = Product.objects.exclude(product_type='rental')
     rental_qs = Product.objects.filter(product_type='rental')
 
     def _sale_stats(qs):
-        total = qs.count()
-        available = qs.filter(available=True).count()
-        low_stock = qs.filter(stock__lt=5, stock__gt=0).count()
-        out_of_stock = qs.filter(stock=0).count()
+        # Un solo recorrido con FILTER; los alias no pueden coincidir con nombres de campo
+        counts = qs.aggregate(
+            n_total=Count('id'),
+            n_available=Count('id', filter=Q(available=True)),
+            n_low_stock=Count('id', filter=Q(stock__lt=5, stock__gt=0)),
+            n_out_of_stock=Count('id', filter=Q(stock=0)),
+        )
         sale_value = Decimal('0.00')
         cost_value = Decimal('0.00')
         margins = []
@@ -1764,10 +1883,10 @@ def inventory_dashboard(request):
         margin_pct = (profit / cost_value * Decimal('100')) if cost_value > 0 else Decimal('0.00')
         avg_margin = (sum(margins) / Decimal(len(margins))) if margins else Decimal('0.00')
         return {
-            'total': total,
-            'available': available,
-            'low_stock': low_stock,
-            'out_of_stock': out_of_stock,
+            'total': counts['n_total'],
+            'available': counts['n_available'],
+            'low_stock': counts['n_low_stock'],
+            'out_of_stock': counts['n_out_of_stock'],
             'sale_value': sale_value,
             'cost_value': cost_value,
             'profit': profit,
@@ -1776,10 +1895,12 @@ def inventory_dashboard(request):
         }
 
     def _rental_stats(qs):
-        total = qs.count()
-        available = qs.filter(available=True).count()
-        unavailable = qs.filter(available=False).count()
-        units = qs.aggregate(s=Sum('stock'))['s'] or 0
+        counts = qs.aggregate(
+            n_total=Count('id'),
+            n_available=Count('id', filter=Q(available=True)),
+            n_unavailable=Count('id', filter=Q(available=False)),
+            n_units=Sum('stock'),
+        )
         commercial_value = Decimal('0.00')
         cost_value = Decimal('0.00')
         margins = []
@@ -1799,10 +1920,10 @@ def inventory_dashboard(request):
         )
         avg_margin = (sum(margins) / Decimal(len(margins))) if margins else Decimal('0.00')
         return {
-            'total': total,
-            'available': available,
-            'unavailable': unavailable,
-            'units': units,
+            'total': counts['n_total'],
+            'available': counts['n_available'],
+            'unavailable': counts['n_unavailable'],
+            'units': counts['n_units'] or 0,
             'commercial_value': commercial_value,
             'cost_value': cost_value,
             'difference': difference,
@@ -1820,15 +1941,25 @@ def inventory_dashboard(request):
         .order_by('-created_at')
     )
 
-    sale_page_obj = Paginator(sale_products, 15).get_page(request.GET.get('sale_page'))
-    rental_page_obj = Paginator(rental_products, 15).get_page(request.GET.get('rental_page'))
+    # Los totales ya salieron de los aggregates de arriba: sin un segundo COUNT(*)
+    sale_page_obj = CachedCountPaginator(
+        sale_products, 15, known_count=sale_stats['total']
+    ).get_page(request.GET.get('sale_page'))
+    rental_page_obj = CachedCountPaginator(
+        rental_products, 15, known_count=rental_stats['total']
+    ).get_page(request.GET.get('rental_page'))
 
     combos_qs = RentalCombo.objects.prefetch_related('items').order_by('-created_at')
     combo_page_obj = Paginator(combos_qs, 15).get_page(request.GET.get('combo_page'))
+    combo_counts = RentalCombo.objects.aggregate(
+        n_total=Count('id'),
+        n_available=Count('id', filter=Q(available=True)),
+        n_for_events=Count('id', filter=Q(for_events=True)),
+    )
     combo_stats = {
-        'total': combos_qs.count(),
-        'available': combos_qs.filter(available=True).count(),
-        'for_events': combos_qs.filter(for_events=True).count(),
+        'total': combo_counts['n_total'],
+        'available': combo_counts['n_available'],
+        'for_events': combo_counts['n_for_events'],
     }
 
     context = {
@@ -1845,9 +1976,19 @@ def inventory_dashboard(request):
 @staff_member_required
 def inventory_list(request):
     """List all products for inventory management"""
-    products = Product.objects.select_related('category').prefetch_related('rental_prices').order_by('-created_at')
+    # Solo las columnas que pinta la tabla (sin descripción, keywords ni datos de alquiler)
+    products = (
+        Product.objects
+        .select_related('category')
+        .prefetch_related('rental_prices')
+        .only(
+            'id', 'name', 'slug', 'product_type', 'price', 'promotional_price', 'purchase_cost',
+            'stock', 'available', 'image', 'created_at', 'category__name',
+        )
+        .order_by('-created_at')
+    )
     
-    paginator = Paginator(products, 20)
+    paginator = CachedCountPaginator(products, 20, cache_key=_inventory_count_cache_key(request, 'all'))
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
@@ -1886,27 +2027,7 @@ def inventory_create(request):
             _process_rental_prices(request, product)
             
             # Process new attributes
-            new_attr_index = 0
-            while True:
-                new_key = request.POST.get(f'new_attribute_key_{new_attr_index}', '').strip()
-                new_value = request.POST.get(f'new_attribute_value_{new_attr_index}', '').strip()
-                new_order = request.POST.get(f'new_attribute_order_{new_attr_index}', '0')
-                
-                if not new_key or not new_value:
-                    break
-                
-                try:
-                    order = int(new_order)
-                except (ValueError, TypeError):
-                    order = 0
-                
-                ProductAttribute.objects.create(
-                    product=product,
-                    key=new_key,
-                    value=new_value,
-                    order=order
-                )
-                new_attr_index += 1
+            ProductAttribute.objects.bulk_create(_new_attributes_from_post(request, product), batch_size=100)
             
             messages.success(request, f'Producto {product.name} creado exitosamente')
             return redirect('store:inventory_detail', product_id=product.id)
@@ -1975,15 +2096,42 @@ def _process_rental_prices(request, product):
     product.sync_rental_catalog_price()
 
 
+def _new_attributes_from_post(request, product) -> list:
+    """
+    Lee las filas new_attribute_*_{i} del POST (hasta la primera vacía) y
+    devuelve ProductAttribute sin guardar, uno por clave (la última gana).
+    """
+    new_attrs = {}
+    new_attr_index = 0
+    while True:
+        new_key = request.POST.get(f'new_attribute_key_{new_attr_index}', '').strip()
+        new_value = request.POST.get(f'new_attribute_value_{new_attr_index}', '').strip()
+        new_order = request.POST.get(f'new_attribute_order_{new_attr_index}', '0')
+
+        if not new_key or not new_value:
+            break
+
+        try:
+            order = int(new_order)
+        except (ValueError, TypeError):
+            order = 0
+
+        new_attrs[new_key] = ProductAttribute(product=product, key=new_key, value=new_value, order=order)
+        new_attr_index += 1
+    return list(new_attrs.values())
+
+
 def _process_attributes(request, product):
     """Process attribute create/update/delete from POST data"""
     # Delete attributes marked for deletion
+    delete_ids = []
     for attr_id in request.POST.getlist('delete_attribute'):
         try:
-            attr = ProductAttribute.objects.get(id=int(attr_id), product=product)
-            attr.delete()
-        except (ValueError, ProductAttribute.DoesNotExist):
+            delete_ids.append(int(attr_id))
+        except ValueError:
             pass
+    if delete_ids:
+        ProductAttribute.objects.filter(product=product, id__in=delete_ids).delete()
 
     # Update existing attributes
     existing_attr_ids = set()
@@ -2008,41 +2156,29 @@ def _process_attributes(request, product):
                             attr.order = 0
                         attr.save()
                     else:
-                        attr.delete()
+                        # Sin clave/valor: se elimina en el barrido final
+                        existing_attr_ids.discard(attr_id_int)
                 except ProductAttribute.DoesNotExist:
                     pass
             except (ValueError, TypeError):
                 pass
 
-    # Create new attributes (use get_or_create to avoid unique_together violation)
-    new_attr_index = 0
-    created_ids = set()
-    while True:
-        new_key = request.POST.get(f'new_attribute_key_{new_attr_index}', '').strip()
-        new_value = request.POST.get(f'new_attribute_value_{new_attr_index}', '').strip()
-        new_order = request.POST.get(f'new_attribute_order_{new_attr_index}', '0')
-
-        if not new_key or not new_value:
-            break
-
-        try:
-            order = int(new_order)
-        except (ValueError, TypeError):
-            order = 0
-
-        attr, created = ProductAttribute.objects.update_or_create(
-            product=product,
-            key=new_key,
-            defaults={'value': new_value, 'order': order}
+    # Create new attributes (upsert on (product, key) to avoid unique_together violation)
+    new_attrs = _new_attributes_from_post(request, product)
+    if new_attrs:
+        ProductAttribute.objects.bulk_create(
+            new_attrs,
+            batch_size=100,
+            update_conflicts=True,
+            unique_fields=['product', 'key'],
+            update_fields=['value', 'order', 'updated_at'],
         )
-        created_ids.add(attr.id)
-        new_attr_index += 1
+    new_keys = {attr.key for attr in new_attrs}
 
     # Delete attributes not in form (removed via JS) - but NOT newly created ones
-    keep_ids = existing_attr_ids | created_ids
-    for attr in ProductAttribute.objects.filter(product=product):
-        if attr.id not in keep_ids:
-            attr.delete()
+    ProductAttribute.objects.filter(product=product).exclude(
+        Q(id__in=existing_attr_ids) | Q(key__in=new_keys)
+    ).delete()
 
 
 @staff_member_required
@@ -2200,14 +2336,28 @@ def inventory_delete(request, product_id):
 
 
 @staff_member_required
+@transaction.atomic
 def inventory_duplicate(request, product_id):
     """Duplicate a product and redirect to edit the new one"""
-    product = get_object_or_404(Product, id=product_id)
+    # Todos los hijos (incluidas las imágenes de cada variación) en una consulta por relación
+    product = get_object_or_404(
+        Product.objects.prefetch_related(
+            'attributes',
+            'rental_prices',
+            'technical_specs',
+            'images',
+            'variations__images',
+            'related_products',
+        ),
+        id=product_id,
+    )
     base_name = f"{product.name} (Copia)"
     base_slug = slugify(base_name)
+    # Traer de una vez los slugs que podrían chocar y elegir el siguiente libre en memoria
+    existing_slugs = set(Product.objects.filter(slug__startswith=base_slug).values_list('slug', flat=True))
     slug = base_slug
     counter = 1
-    while Product.objects.filter(slug=slug).exists():
+    while slug in existing_slugs:
         counter += 1
         slug = f"{base_slug}-{counter}"
 
@@ -2230,37 +2380,50 @@ def inventory_duplicate(request, product_id):
         unit_measure=product.unit_measure,
     )
 
-    for attr in product.attributes.all():
-        ProductAttribute.objects.create(
+    # Un INSERT por tipo de hijo en lugar de uno por fila
+    ProductAttribute.objects.bulk_create([
+        ProductAttribute(
             product=new_product,
             key=attr.key,
             value=attr.value,
             order=attr.order,
         )
-    for rental_price in product.rental_prices.all():
-        ProductRentalPrice.objects.create(
+        for attr in product.attributes.all()
+    ])
+    ProductRentalPrice.objects.bulk_create([
+        ProductRentalPrice(
             product=new_product,
             period_type=rental_price.period_type,
             price=rental_price.price,
             is_active=rental_price.is_active,
             order=rental_price.order,
         )
-    for spec in product.technical_specs.all():
-        ProductTechnicalSpec.objects.create(
+        for rental_price in product.rental_prices.all()
+    ])
+    # bulk_create no emite post_save: las tarifas de la copia deben invalidar el catálogo
+    bump_catalog_cache_version_on_commit()
+    ProductTechnicalSpec.objects.bulk_create([
+        ProductTechnicalSpec(
             product=new_product,
             name=spec.name,
             description=spec.description,
             order=spec.order,
         )
-    for img in product.images.all():
-        ProductImage.objects.create(
+        for spec in product.technical_specs.all()
+    ])
+    ProductImage.objects.bulk_create([
+        ProductImage(
             product=new_product,
             image=img.image,
             alt_text=img.alt_text,
             is_primary=img.is_primary,
         )
-    for var in product.variations.all():
-        new_var = ProductVariation.objects.create(
+        for img in product.images.all()
+    ])
+    # Variaciones primero (para obtener sus PK) y luego todas sus imágenes en un solo INSERT
+    source_variations = list(product.variations.all())
+    new_variations = ProductVariation.objects.bulk_create([
+        ProductVariation(
             product=new_product,
             variation_type=var.variation_type,
             name=var.name,
@@ -2271,14 +2434,20 @@ def inventory_duplicate(request, product_id):
             sku='',
             image=var.image,
         )
-        for vimg in var.images.all():
-            ProductVariationImage.objects.create(
-                variation=new_var,
-                image=vimg.image,
-                alt_text=vimg.alt_text,
-                is_primary=vimg.is_primary,
-            )
-    new_product.related_products.set(product.related_products.all())
+        for var in source_variations
+    ])
+    ProductVariationImage.objects.bulk_create([
+        ProductVariationImage(
+            variation=new_var,
+            image=vimg.image,
+            alt_text=vimg.alt_text,
+            is_primary=vimg.is_primary,
+        )
+        for var, new_var in zip(source_variations, new_variations)
+        for vimg in var.images.all()
+    ])
+    # Producto recién creado: add() inserta directo, sin la lectura de diferencias que hace set()
+    new_product.related_products.add(*product.related_products.all())
 
     messages.success(request, f'Producto duplicado como "{new_product.name}". Puedes modificarlo a continuación.')
     return redirect('store:inventory_edit', product_id=new_product.id)
@@ -2287,9 +2456,11 @@ def inventory_duplicate(request, product_id):
 @staff_member_required
 def inventory_toggle_available(request, product_id):
     """Toggle product availability"""
-    product = get_object_or_404(Product, id=product_id)
+    product = get_object_or_404(Product.objects.only('id', 'name', 'available'), id=product_id)
+    # Un solo UPDATE de la columna; update() no emite post_save, así que se invalida el catálogo aquí
+    Product.objects.filter(id=product.id).update(available=~F('available'), updated_at=timezone.now())
+    bump_catalog_cache_version_on_commit()
     product.available = not product.available
-    product.save()
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({
@@ -2344,10 +2515,29 @@ def inventory_add_image(request, product_id):
     return render(request, 'store/inventory/add_image.html', context)
 
 
+@staff_member_required
+def inventory_bulk_add_images(request, product_id):
+    """Add several images to a product in one request (una sola inserción)"""
+    product = get_object_or_404(Product.objects.only('id'), id=product_id)
+    if request.method != 'POST':
+        return redirect('store:inventory_add_image', product_id=product.id)
+    form = BulkImageUploadForm(request.POST, request.FILES)
+    if form.is_valid():
+        images = ProductImage.objects.bulk_create(
+            [ProductImage(product=product, image=f) for f in form.cleaned_data['images']]
+        )
+        messages.success(request, f'{len(images)} imágenes agregadas exitosamente')
+    else:
+        messages.error(request, 'No se pudieron subir las imágenes: ' + ' '.join(form.errors.get('images', [])))
+    if request.POST.get('next') == 'edit':
+        return redirect('store:inventory_edit', product_id=product.id)
+    return redirect('store:inventory_detail', product_id=product.id)
+
+
 @staff_member_required
 def inventory_delete_image(request, product_id, image_id):
     """Delete product image"""
-    image = get_object_or_404(ProductImage, id=image_id, product_id=product_id)
+    image = get_object_or_404(ProductImage.objects.select_related('product'), id=image_id, product_id=product_id)
     
     if request.method == 'POST':
         image.delete()
@@ -2390,7 +2580,7 @@ def inventory_add_variation(request, product_id):
 @staff_member_required
 def inventory_edit_variation(request, product_id, variation_id):
     """Edit product variation"""
-    variation = get_object_or_404(ProductVariation, id=variation_id, product_id=product_id)
+    variation = get_object_or_404(ProductVariation.objects.select_related('product'), id=variation_id, product_id=product_id)
     
     if request.method == 'POST':
         form = ProductVariationForm(request.POST, request.FILES, instance=variation)
@@ -2412,7 +2602,7 @@ def inventory_edit_variation(request, product_id, variation_id):
 @staff_member_required
 def inventory_delete_variation(request, product_id, variation_id):
     """Delete product variation"""
-    variation = get_object_or_404(ProductVariation, id=variation_id, product_id=product_id)
+    variation = get_object_or_404(ProductVariation.objects.select_related('product'), id=variation_id, product_id=product_id)
     
     if request.method == 'POST':
         variation.delete()
@@ -2430,7 +2620,7 @@ def inventory_delete_variation(request, product_id, variation_id):
 @staff_member_required
 def inventory_add_variation_image(request, product_id, variation_id):
     """Add image to variation"""
-    variation = get_object_or_404(ProductVariation, id=variation_id, product_id=product_id)
+    variation = get_object_or_404(ProductVariation.objects.select_related('product'), id=variation_id, product_id=product_id)
     
     if request.method == 'POST':
         form = ProductVariationImageForm(request.POST, request.FILES)
@@ -2451,10 +2641,30 @@ def inventory_add_variation_image(request, product_id, variation_id):
     return render(request, 'store/inventory/add_variation_image.html', context)
 
 
+@staff_member_required
+def inventory_bulk_add_variation_images(request, product_id, variation_id):
+    """Add several images to a variation in one request (una sola inserción)"""
+    variation = get_object_or_404(ProductVariation.objects.only('id'), id=variation_id, product_id=product_id)
+    if request.method != 'POST':
+        return redirect('store:inventory_detail', product_id=product_id)
+    form = BulkImageUploadForm(request.POST, request.FILES)
+    if form.is_valid():
+        images = ProductVariationImage.objects.bulk_create(
+            [ProductVariationImage(variation=variation, image=f) for f in form.cleaned_data['images']]
+        )
+        messages.success(request, f'{len(images)} imágenes agregadas exitosamente')
+    else:
+        messages.error(request, 'No se pudieron subir las imágenes: ' + ' '.join(form.errors.get('images', [])))
+    return redirect('store:inventory_detail', product_id=product_id)
+
+
 @staff_member_required
 def inventory_delete_variation_image(request, product_id, variation_id, image_id):
     """Delete variation image"""
-    image = get_object_or_404(ProductVariationImage, id=image_id, variation_id=variation_id)
+    image = get_object_or_404(
+        ProductVariationImage.objects.select_related('variation__product'),
+        id=image_id, variation_id=variation_id, variation__product_id=product_id,
+    )
     
     if request.method == 'POST':
         image.delete()
@@ -2496,7 +2706,7 @@ def inventory_add_technical_spec(request, product_id):
 @staff_member_required
 def inventory_edit_technical_spec(request, product_id, spec_id):
     """Edit technical spec"""
-    spec = get_object_or_404(ProductTechnicalSpec, id=spec_id, product_id=product_id)
+    spec = get_object_or_404(ProductTechnicalSpec.objects.select_related('product'), id=spec_id, product_id=product_id)
     
     if request.method == 'POST':
         form = ProductTechnicalSpecForm(request.POST, instance=spec)
@@ -2518,7 +2728,7 @@ def inventory_edit_technical_spec(request, product_id, spec_id):
 @staff_member_required
 def inventory_delete_technical_spec(request, product_id, spec_id):
     """Delete technical spec"""
-    spec = get_object_or_404(ProductTechnicalSpec, id=spec_id, product_id=product_id)
+    spec = get_object_or_404(ProductTechnicalSpec.objects.select_related('product'), id=spec_id, product_id=product_id)
     
     if request.method == 'POST':
         spec.delete()
@@ -2559,7 +2769,7 @@ def inventory_add_attribute(request, product_id):
 @staff_member_required
 def inventory_edit_attribute(request, product_id, attribute_id):
     """Edit product attribute"""
-    attribute = get_object_or_404(ProductAttribute, id=attribute_id, product_id=product_id)
+    attribute = get_object_or_404(ProductAttribute.objects.select_related('product'), id=attribute_id, product_id=product_id)
     
     if request.method == 'POST':
         form = ProductAttributeForm(request.POST, instance=attribute)
@@ -2581,7 +2791,7 @@ def inventory_edit_attribute(request, product_id, attribute_id):
 @staff_member_required
 def inventory_delete_attribute(request, product_id, attribute_id):
     """Delete product attribute"""
-    attribute = get_object_or_404(ProductAttribute, id=attribute_id, product_id=product_id)
+    attribute = get_object_or_404(ProductAttribute.objects.select_related('product'), id=attribute_id, product_id=product_id)
     
     if request.method == 'POST':
         attribute.delete()
@@ -3879,34 +4089,44 @@ def quotation(request):
     # Si hay sesión de cotización, úsala como base (AJAX)
     session_quote = _get_quote_session(request)
     if session_quote:
+        # Resolver productos y tarifas activas de la sesión en una consulta cada uno
+        parsed_lines = []
         for line_key, entry in session_quote.items():
+            product_id, rental_from_key = _parse_quote_line_key(line_key)
+            if product_id is None:
+                continue
+            entry = _normalize_quote_entry(entry)
+            rental_price_id = entry.get('rental_price_id') or rental_from_key
+            parsed_lines.append((line_key, product_id, rental_price_id, entry))
+        # En edición permitir productos aunque ya no estén "available"
+        product_qs = Product.objects.select_related('category')
+        if not editing_quote:
+            product_qs = product_qs.filter(available=True)
+        products_by_id = product_qs.in_bulk([pid for _, pid, _, _ in parsed_lines])
+        tariffs_by_id = ProductRentalPrice.objects.filter(is_active=True).in_bulk(
+            [rid for _, _, rid, _ in parsed_lines if rid]
+        )
+        for line_key, product_id, rental_price_id, entry in parsed_lines:
+            product = products_by_id.get(product_id)
+            if not product:
+                continue
             try:
-                product_id, rental_from_key = _parse_quote_line_key(line_key)
-                # En edición permitir productos aunque ya no estén "available"
-                product_qs = Product.objects.select_related('category')
-                if editing_quote:
-                    product = product_qs.get(id=product_id)
-                else:
-                    product = product_qs.get(id=product_id, available=True)
-                entry = _normalize_quote_entry(entry)
                 qty = entry['qty']
-                rental_price_id = entry.get('rental_price_id') or rental_from_key
-                list_unit = _quote_base_unit_price(product, rental_price_id=rental_price_id)
+                list_unit = _quote_base_unit_price(product, rental_price_id=rental_price_id, tariffs=tariffs_by_id)
                 price = _quote_unit_price(
                     product,
                     discount_value=entry.get('discount_value', entry.get('discount_percent', 0)),
                     discount_type=entry.get('discount_type', 'percent'),
                     rental_price_id=rental_price_id,
+                    base_price=list_unit,
                 )
                 subtotal = price * qty
                 total += subtotal
                 period_label = ''
                 display_name = product.name
                 if rental_price_id:
-                    tariff = ProductRentalPrice.objects.filter(
-                        id=rental_price_id, product_id=product.id, is_active=True
-                    ).first()
-                    if tariff:
+                    tariff = tariffs_by_id.get(rental_price_id)
+                    if tariff and tariff.product_id == product.id:
                         period_label = tariff.get_period_type_display()
                         display_name = f'{product.name} · {period_label}'
                 quotation_items.append({
@@ -3923,7 +4143,7 @@ def quotation(request):
                     'unit_price': price,
                     'subtotal': subtotal,
                 })
-            except (Product.DoesNotExist, ValueError, TypeError):
+            except (ValueError, TypeError):
                 continue
 
     # Obtener productos seleccionados desde GET o POST (fallback/compat)
@@ -3968,96 +4188,105 @@ def quotation(request):
                 client_kind = (form.cleaned_data.get('client_kind') or '').strip()
                 client_departamento = (form.cleaned_data.get('client_departamento') or '').strip()
                 client_city = (form.cleaned_data.get('client_city') or '').strip()
+                # Un solo mensaje con todos los faltantes
+                client_errors = []
                 if not client_kind:
-                    messages.error(request, 'Selecciona Persona natural o Empresa.')
-                    valid_client = False
+                    client_errors.append('Selecciona Persona natural o Empresa.')
                 if not client_name:
-                    messages.error(request, 'Para cliente no registrado debes llenar el nombre.')
-                    valid_client = False
+                    client_errors.append('Para cliente no registrado debes llenar el nombre.')
                 if not client_email:
-                    messages.error(request, 'Para cliente no registrado el correo es obligatorio.')
-                    valid_client = False
+                    client_errors.append('Para cliente no registrado el correo es obligatorio.')
                 if not client_phone:
-                    messages.error(request, 'Para cliente no registrado el teléfono es obligatorio.')
-                    valid_client = False
+                    client_errors.append('Para cliente no registrado el teléfono es obligatorio.')
                 if not client_departamento or not client_city:
-                    messages.error(request, 'Para cliente no registrado selecciona Departamento y Ciudad.')
+                    client_errors.append('Para cliente no registrado selecciona Departamento y Ciudad.')
+                if client_errors:
+                    messages.error(request, ' '.join(client_errors))
                     valid_client = False
 
         if form.is_valid() and product_ids and valid_client:
-            is_update = bool(editing_quote and _quotation_can_edit(editing_quote))
-            if is_update and editing_quote.stock_deducted:
-                _restore_stock_for_quotation(editing_quote)
+            with transaction.atomic():
+                is_update = bool(editing_quote and _quotation_can_edit(editing_quote))
+                if is_update and editing_quote.stock_deducted:
+                    _restore_stock_for_quotation(editing_quote)
+
+                if is_update:
+                    quotation_obj = editing_quote
+                    quotation_obj.existing_client = selected_client if (selected_client and not unregistered) else None
+                    quotation_obj.client_kind = client_kind or 'existing'
+                    quotation_obj.client_name = client_name or ''
+                    quotation_obj.client_email = client_email or ''
+                    quotation_obj.client_phone = client_phone or ''
+                    quotation_obj.client_departamento = client_departamento or ''
+                    quotation_obj.client_city = client_city or ''
+                    quotation_obj.notes = form.cleaned_data.get('notes', '') or ''
+                    quotation_obj.total = Decimal('0.00')
+                    quotation_obj.save()
+                    quotation_obj.items.all().delete()
+                else:
+                    # Crear cotización en BD (registro)
+                    quotation_obj = Quotation.objects.create(
+                        created_by=request.user if request.user.is_authenticated else None,
+                        existing_client=selected_client if (selected_client and not unregistered) else None,
+                        client_kind=client_kind or 'existing',
+                        client_name=client_name or '',
+                        client_email=client_email or '',
+                        client_phone=client_phone or '',
+                        client_departamento=client_departamento or '',
+                        client_city=client_city or '',
+                        notes=form.cleaned_data.get('notes', '') or '',
+                        total=Decimal('0.00'),
+                    )
 
-            if is_update:
-                quotation_obj = editing_quote
-                quotation_obj.existing_client = selected_client if (selected_client and not unregistered) else None
-                quotation_obj.client_kind = client_kind or 'existing'
-                quotation_obj.client_name = client_name or ''
-                quotation_obj.client_email = client_email or ''
-                quotation_obj.client_phone = client_phone or ''
-                quotation_obj.client_departamento = client_departamento or ''
-                quotation_obj.client_city = client_city or ''
-                quotation_obj.notes = form.cleaned_data.get('notes', '') or ''
-                quotation_obj.total = Decimal('0.00')
-                quotation_obj.save()
-                quotation_obj.items.all().delete()
-            else:
-                # Crear cotización en BD (registro)
-                quotation_obj = Quotation.objects.create(
-                    created_by=request.user if request.user.is_authenticated else None,
-                    existing_client=selected_client if (selected_client and not unregistered) else None,
-                    client_kind=client_kind or 'existing',
-                    client_name=client_name or '',
-                    client_email=client_email or '',
-                    client_phone=client_phone or '',
-                    client_departamento=client_departamento or '',
-                    client_city=client_city or '',
-                    notes=form.cleaned_data.get('notes', '') or '',
-                    total=Decimal('0.00'),
+                # Resolver productos y tarifas de todas las líneas en una consulta cada uno
+                parsed_lines = []
+                for line_key, entry in session_quote.items():
+                    product_id, rental_from_key = _parse_quote_line_key(line_key)
+                    if product_id is None:
+                        continue
+                    entry = _normalize_quote_entry(entry)
+                    rental_price_id = entry.get('rental_price_id') or rental_from_key
+                    parsed_lines.append((product_id, rental_price_id, entry))
+                # En edición permitir productos aunque ya no estén "available"
+                line_products = Product.objects.all() if is_update else Product.objects.filter(available=True)
+                products_by_id = line_products.in_bulk([pid for pid, _, _ in parsed_lines])
+                rental_by_id = ProductRentalPrice.objects.in_bulk(
+                    [rid for _, rid, _ in parsed_lines if rid]
                 )
 
-            running_total = Decimal('0.00')
-            for line_key, entry in session_quote.items():
-                try:
-                    product_id, rental_from_key = _parse_quote_line_key(line_key)
-                    if is_update:
-                        product = Product.objects.get(id=product_id)
-                    else:
-                        product = Product.objects.get(id=product_id, available=True)
-                except (Product.DoesNotExist, ValueError, TypeError):
-                    continue
-                entry = _normalize_quote_entry(entry)
-                qty = entry['qty']
-                rental_price_id = entry.get('rental_price_id') or rental_from_key
-                list_unit = _quote_base_unit_price(product, rental_price_id=rental_price_id)
-                price = _quote_unit_price(
-                    product,
-                    discount_value=entry.get('discount_value', entry.get('discount_percent', 0)),
-                    discount_type=entry.get('discount_type', 'percent'),
-                    rental_price_id=rental_price_id,
-                )
-                rental_obj = None
-                if rental_price_id:
-                    rental_obj = ProductRentalPrice.objects.filter(
-                        id=rental_price_id, product_id=product.id
-                    ).first()
-                item = QuotationItem.objects.create(
-                    quotation=quotation_obj,
-                    product=product,
-                    quantity=qty,
-                    unit_price=price,
-                    list_unit_price=list_unit,
-                    rental_price=rental_obj,
-                    subtotal=price * qty,
-                )
-                running_total += item.subtotal
+                new_items = []
+                for product_id, rental_price_id, entry in parsed_lines:
+                    product = products_by_id.get(product_id)
+                    if not product:
+                        continue
+                    qty = entry['qty']
+                    list_unit = _quote_base_unit_price(product, rental_price_id=rental_price_id, tariffs=rental_by_id)
+                    price = _quote_unit_price(
+                        product,
+                        discount_value=entry.get('discount_value', entry.get('discount_percent', 0)),
+                        discount_type=entry.get('discount_type', 'percent'),
+                        rental_price_id=rental_price_id,
+                        base_price=list_unit,
+                    )
+                    rental_obj = rental_by_id.get(rental_price_id) if rental_price_id else None
+                    if rental_obj and rental_obj.product_id != product.id:
+                        rental_obj = None
+                    new_items.append(QuotationItem(
+                        quotation=quotation_obj,
+                        product=product,
+                        quantity=qty,
+                        unit_price=price,
+                        list_unit_price=list_unit,
+                        rental_price=rental_obj,
+                        subtotal=price * qty,
+                    ))
+                QuotationItem.objects.bulk_create(new_items)
 
-            quotation_obj.total = running_total
-            quotation_obj.save(update_fields=['total', 'updated_at'])
+                quotation_obj.total = sum((it.subtotal for it in new_items), Decimal('0.00'))
+                quotation_obj.save(update_fields=['total', 'updated_at'])
 
-            if is_update and quotation_obj.order_status in _stock_commit_statuses():
-                _deduct_stock_for_quotation(quotation_obj)
+                if is_update and quotation_obj.order_status in _stock_commit_statuses():
+                    _deduct_stock_for_quotation(quotation_obj)
 
             # Limpiar sesión de cotización / edición
             _clear_quotation_edit_session(request)
@@ -4093,22 +4322,25 @@ def quotation(request):
         product_ids = request.GET.getlist('products')
         session_quote = _get_quote_session(request)
 
+        parsed_get = [_parse_quote_line_key(raw) for raw in product_ids]
+        parsed_get = [(pid, rid) for pid, rid in parsed_get if pid is not None]
+        get_products = Product.objects.filter(available=True).in_bulk([pid for pid, _ in parsed_get])
+        get_tariffs = ProductRentalPrice.objects.filter(is_active=True).in_bulk(
+            [rid for _, rid in parsed_get if rid]
+        )
+
         seen = set()
         unique_line_keys = []
-        for raw in product_ids:
-            product_id, rental_price_id = _parse_quote_line_key(raw)
-            if product_id is None:
+        for product_id, rental_price_id in parsed_get:
+            prod = get_products.get(product_id)
+            if not prod:
                 continue
             if rental_price_id:
                 key = f'{product_id}:{rental_price_id}'
             else:
                 # Producto alquiler sin tarifa: no agregar precio catálogo solo;
                 # el usuario elige tarifas en el panel.
-                try:
-                    prod = Product.objects.only('id', 'product_type').get(id=product_id, available=True)
-                    if prod.is_rental:
-                        continue
-                except Product.DoesNotExist:
+                if prod.is_rental:
                     continue
                 key = str(product_id)
             if key not in seen:
@@ -4117,22 +4349,19 @@ def quotation(request):
 
         for key, product_id, rental_price_id in unique_line_keys:
             try:
-                product = Product.objects.get(id=product_id, available=True)
-                if rental_price_id and not ProductRentalPrice.objects.filter(
-                    id=rental_price_id, product_id=product_id, is_active=True
-                ).exists():
+                product = get_products[product_id]
+                tariff = get_tariffs.get(rental_price_id) if rental_price_id else None
+                if rental_price_id and (not tariff or tariff.product_id != product_id):
                     continue
                 already = any(it.get('line_key') == key for it in quotation_items)
                 if already or key in session_quote:
                     continue
-                list_unit = _quote_base_unit_price(product, rental_price_id=rental_price_id)
+                list_unit = _quote_base_unit_price(product, rental_price_id=rental_price_id, tariffs=get_tariffs)
                 period_label = ''
                 display_name = product.name
-                if rental_price_id:
-                    tariff = ProductRentalPrice.objects.filter(id=rental_price_id).first()
-                    if tariff:
-                        period_label = tariff.get_period_type_display()
-                        display_name = f'{product.name} · {period_label}'
+                if tariff:
+                    period_label = tariff.get_period_type_display()
+                    display_name = f'{product.name} · {period_label}'
                 quotation_items.append({
                     'product': product,
                     'line_key': key,
@@ -4155,7 +4384,7 @@ def quotation(request):
                     'discount_percent': 0.0,
                     'rental_price_id': rental_price_id,
                 }
-            except (Product.DoesNotExist, ValueError, TypeError):
+            except (ValueError, TypeError):
                 continue
         request.session['quotation'] = session_quote
         request.session.modified = True
@@ -4168,42 +4397,20 @@ def quotation(request):
         if item.get('rental_price_id'):
             continue
         selected_product_ids.append(pid)
-    if selected_product_ids:
-        all_products = (
-            Product.objects.filter(available=True)
-            .exclude(id__in=selected_product_ids)
-            .select_related('category')
-            .prefetch_related(
-                Prefetch(
-                    'rental_prices',
-                    queryset=ProductRentalPrice.objects.filter(is_active=True).order_by('order', 'period_type'),
-                )
-            )
-            .order_by('category__name', 'name')
-        )
-    else:
-        all_products = (
-            Product.objects.filter(available=True)
-            .select_related('category')
-            .prefetch_related(
-                Prefetch(
-                    'rental_prices',
-                    queryset=ProductRentalPrice.objects.filter(is_active=True).order_by('order', 'period_type'),
-                )
-            )
-            .order_by('category__name', 'name')
-        )
+    # Agrupación cacheada de todo el catálogo; solo se excluyen aquí los ya seleccionados
+    excluded_ids = set(selected_product_ids)
     products_by_category = {}
-    for product in all_products:
-        category_name = product.category.name
-        if category_name not in products_by_category:
-            products_by_category[category_name] = []
-        products_by_category[category_name].append(product)
+    for category_name, products in _quotation_catalog_by_category().items():
+        kept = [product for product in products if product.id not in excluded_ids]
+        if kept:
+            products_by_category[category_name] = kept
+    all_products = [product for products in products_by_category.values() for product in products]
     
     # Obtener todas las categorías para el selector
-    categories = Category.objects.filter(products__available=True).distinct().order_by('name')
+    categories = Category.objects.filter(
+        Exists(Product.objects.filter(category_id=OuterRef('pk'), available=True))
+    ).order_by('name')
     
-    clients = User.objects.filter(is_staff=False).order_by('first_name', 'last_name', 'username')
     context = {
         'form': form,
         'quotation_items': quotation_items,
@@ -4213,12 +4420,33 @@ def quotation(request):
         'all_products': all_products,
         'products_by_category': products_by_category,
         'categories': categories,
-        'clients': clients,
         'editing_quote': editing_quote,
     }
     return render(request, 'store/quotation.html', context)
 
 
+def _quotation_catalog_by_category() -> dict:
+    """
+    {nombre de categoría: [productos disponibles]} para el panel de cotización.
+    Se cachea por versión de catálogo (ver store.signals); el timeout corto acota
+    la desactualización cuando el cache es local a cada proceso.
+    """
+    key = f'quotation:catalog_by_category:v{catalog_cache_version()}'
+    grouping = cache.get(key)
+    if grouping is None:
+        products = Product.objects.available_catalog().prefetch_related(
+            Prefetch(
+                'rental_prices',
+                queryset=ProductRentalPrice.objects.filter(is_active=True).order_by('order', 'period_type'),
+            )
+        )
+        grouping = {}
+        for product in products:
+            grouping.setdefault(product.category.name, []).append(product)
+        cache.set(key, grouping, 300)
+    return grouping
+
+
 @staff_member_required
 def quotation_edit(request, quotation_id):
     """Carga una cotización existente en el builder para modificarla."""
@@ -4254,6 +4482,55 @@ def quotation_edit_cancel(request, quotation_id):
     return redirect('store:quotation_detail', quotation_id=quotation_id)
 
 
+def _quotation_managers() -> list:
+    """Usuarios que han creado cotizaciones (filtro "Hecha por"); lista cacheada 60 s."""
+    return cache.get_or_set(
+        'quotation:managers',
+        lambda: list(
+            User.objects.filter(Exists(Quotation.objects.filter(created_by_id=OuterRef('pk'))))
+            .only('id', 'username', 'first_name', 'last_name')
+            .order_by('username')
+        ),
+        60,
+    )
+
+
+def _paginate_section(request, qs, page_param, per_page=25):
+    """Página de una tabla con su propio parámetro GET; conserva el resto de la query string."""
+    page_obj = Paginator(qs, per_page).get_page(request.GET.get(page_param))
+    params = request.GET.copy()
+    params.pop(page_param, None)
+    return page_obj, params.urlencode()
+
+
+def _partial_payment_totals(qs):
+    """
+    (abonado, saldo) de un conjunto de cotizaciones con la misma regla que
+    Quotation.amount_paid, sin instanciar cada cotización.
+    """
+    rows = list(qs.values_list('id', 'order_status', 'total', 'partial_payment_amount'))
+    payments = dict(
+        QuotationPayment.objects.filter(quotation_id__in=[r[0] for r in rows])
+        .values('quotation_id')
+        .annotate(s=Sum('amount'))
+        .values_list('quotation_id', 's')
+    )
+    fully_paid = _fully_paid_statuses()
+    paid_sum = Decimal('0.00')
+    remaining_sum = Decimal('0.00')
+    for qid, status, total, partial_amount in rows:
+        total = total or Decimal('0.00')
+        if status in fully_paid:
+            paid = total
+        elif (payments.get(qid) or 0) > 0:
+            paid = payments[qid]
+        else:
+            paid = partial_amount or Decimal('0.00')
+        paid_sum += paid
+        remaining_sum += max(total - paid, Decimal('0.00'))
+    return paid_sum, remaining_sum
+
+
 @staff_member_required
 def quotation_list(request):
     """
@@ -4262,9 +4539,17 @@ def quotation_list(request):
     - Cerradas / pago recibido (con total cancelado)
     Solo se usa estado del pedido (sin columna de estado de cotización).
     """
-    from django.db.models import Exists, OuterRef
-
-    quotes = Quotation.objects.select_related('existing_client', 'created_by').order_by('-created_at')
+    # Solo las columnas que pinta la fila; el perfil entra en el JOIN para display_client_phone
+    quotes = (
+        Quotation.objects.select_related('existing_client__profile', 'created_by')
+        .only(
+            'id', 'created_at', 'client_name', 'client_phone', 'order_status', 'payment_proof',
+            'total', 'partial_payment_amount', 'existing_client_id', 'created_by_id',
+            'existing_client__username', 'existing_client__first_name', 'existing_client__last_name',
+            'existing_client__profile__phone', 'created_by__username',
+        )
+        .order_by('-created_at')
+    )
     rental_lines = QuotationItem.objects.filter(
         quotation_id=OuterRef('pk'),
         product__product_type='rental',
@@ -4293,37 +4578,34 @@ def quotation_list(request):
     other_statuses = ('sin_respuesta', 'rechazado')
 
     pending_qs = quotes.filter(order_status__in=pending_statuses)
-    partial_qs = quotes.filter(order_status='pago_parcial')
+    # amount_paid / remaining_balance recorren los abonos de cada fila
+    partial_qs = quotes.filter(order_status='pago_parcial').prefetch_related('payments')
     paid_qs = quotes.filter(order_status__in=paid_statuses)
     other_qs = quotes.filter(order_status__in=other_statuses)
 
-    def _section(qs, *, is_partial=False):
-        items = list(qs)
-        total = sum((Decimal(str(q.total or 0)) for q in items), Decimal('0.00'))
+    def _section(qs, page_param, *, is_partial=False):
+        # Totales sobre todo el conjunto filtrado; solo se materializa la página actual
+        total = qs.aggregate(s=Sum('total'))['s'] or Decimal('0.00')
+        page_obj, page_query = _paginate_section(request, qs, page_param)
         data = {
-            'items': items,
+            'items': list(page_obj.object_list),
             'total': total,
-            'count': len(items),
+            'count': page_obj.paginator.count,
+            'page_obj': page_obj,
+            'page_param': page_param,
+            'page_query': page_query,
         }
         if is_partial:
-            paid_sum = sum((q.amount_paid for q in items), Decimal('0.00'))
-            remaining_sum = sum((q.remaining_balance for q in items), Decimal('0.00'))
-            data['paid_total'] = paid_sum
-            data['remaining_total'] = remaining_sum
+            data['paid_total'], data['remaining_total'] = _partial_payment_totals(qs)
         return data
 
-    manager_ids = (
-        Quotation.objects.exclude(created_by_id__isnull=True)
-        .values_list('created_by_id', flat=True)
-        .distinct()
-    )
-    managers = User.objects.filter(id__in=manager_ids).order_by('username')
+    managers = _quotation_managers()
 
     return render(request, 'store/quotation_list.html', {
-        'pending': _section(pending_qs),
-        'partial': _section(partial_qs, is_partial=True),
-        'paid': _section(paid_qs),
-        'other': _section(other_qs),
+        'pending': _section(pending_qs, 'p_pendientes'),
+        'partial': _section(partial_qs, 'p_parciales', is_partial=True),
+        'paid': _section(paid_qs, 'p_pagadas'),
+        'other': _section(other_qs, 'p_otras'),
         'managers': managers,
         'filter_cliente': client_search,
         'filter_manager': manager_id,
@@ -4402,7 +4684,7 @@ def sales_list(request):
     - Cotizaciones pagadas
     - Cotizaciones por falta de pago (vencidas esperando pago)
     - Cotizaciones sin pagar (aceptadas / esperando pago vigentes)
-    Cada una muestra las últimas 10 y un total (de todo el conjunto filtrado).
+    Cada una se pagina de a 10 (parámetro GET propio) con un total de todo el conjunto filtrado.
     """
     from django.utils import timezone
 
@@ -4447,24 +4729,26 @@ def sales_list(request):
         Q(order_status='esperando_pago', created_at__gte=expiry_cutoff)
     )
 
-    def _section(qs):
+    def _section(qs, page_param):
         total = qs.aggregate(s=Sum('total'))['s'] or Decimal('0.00')
-        count = qs.count()
-        items = list(qs[:10])
+        page_obj, page_query = _paginate_section(request, qs, page_param, per_page=10)
+        items = list(page_obj.object_list)
         return {
             'items': items,
             'total': total,
-            'count': count,
+            'count': page_obj.paginator.count,
             'showing': len(items),
+            'page_obj': page_obj,
+            'page_param': page_param,
+            'page_query': page_query,
         }
 
-    manager_ids = Quotation.objects.exclude(created_by_id__isnull=True).values_list('created_by_id', flat=True).distinct()
-    managers = User.objects.filter(id__in=manager_ids).order_by('username')
+    managers = _quotation_managers()
 
     return render(request, 'store/manager/sales_list.html', {
-        'paid': _section(paid_qs),
-        'overdue': _section(overdue_qs),
-        'unpaid': _section(unpaid_qs),
+        'paid': _section(paid_qs, 'p_pagadas'),
+        'overdue': _section(overdue_qs, 'p_vencidas'),
+        'unpaid': _section(unpaid_qs, 'p_sin_pagar'),
         'managers': managers,
         'filter_cliente': client_search,
         'filter_manager': manager_id,
@@ -4646,18 +4930,16 @@ def quotation_ajax_set_status(request):
     qid = request.POST.get('quotation_id')
     qs = (request.POST.get('quotation_status') or '').strip()
     os_ = (request.POST.get('order_status') or '').strip()
-    allowed_qs = {c[0] for c in getattr(Quotation, 'QUOTATION_STATUS_CHOICES', [])}
-    allowed_os = {c[0] for c in getattr(Quotation, 'ORDER_STATUS_CHOICES', [])}
     try:
         qobj = Quotation.objects.get(id=int(qid))
     except Exception:
         return JsonResponse({'error': 'Invalid quotation_id'}, status=400)
     update_fields = []
     notify_pago = False
-    if qs and qs in allowed_qs and qs != qobj.quotation_status:
+    if qs and qs in _ALLOWED_QUOTATION_STATUSES and qs != qobj.quotation_status:
         qobj.quotation_status = qs
         update_fields.extend(['quotation_status'])
-    if os_ and os_ in allowed_os and os_ != qobj.order_status:
+    if os_ and os_ in _ALLOWED_ORDER_STATUSES and os_ != qobj.order_status:
         # Estados que requieren comprobante de pago antes de avanzar
         post_payment_statuses = _post_payment_statuses()
         if os_ in post_payment_statuses and not qobj.payment_proof:
@@ -4697,6 +4979,16 @@ def quotation_ajax_set_status(request):
     })
 
 
+# Columnas que usan las líneas en el detalle / PDF (display_name, imagen, categoría, IVA y descuento)
+_QUOTE_ITEM_DISPLAY_FIELDS = (
+    'id', 'quotation_id', 'product_id', 'rental_price_id', 'custom_name',
+    'quantity', 'unit_price', 'list_unit_price', 'subtotal',
+    'product__name', 'product__image', 'product__price', 'product__promotional_price',
+    'product__product_type', 'product__category__name',
+    'rental_price__period_type',
+)
+
+
 def quotation_detail(request, quotation_id):
     """Vista HTML final de una cotización"""
     q = get_object_or_404(
@@ -4705,7 +4997,15 @@ def quotation_detail(request, quotation_id):
         ),
         id=quotation_id,
     )
-    items = q.items.select_related('product', 'product__category').all()
+    # Base e IVA de cada línea calculados en la misma consulta (los precios ya incluyen IVA)
+    iva_money = DecimalField(max_digits=14, decimal_places=4)
+    items = q.items.select_related('product', 'product__category', 'rental_price').only(
+        *_QUOTE_ITEM_DISPLAY_FIELDS
+    ).annotate(
+        base_subtotal=ExpressionWrapper(F('subtotal') / Value(_IVA_DIVISOR), output_field=iva_money),
+    ).annotate(
+        iva_subtotal=ExpressionWrapper(F('subtotal') - F('base_subtotal'), output_field=iva_money),
+    )
     expires_at = q.created_at + timedelta(days=1)
     try:
         combo_booking = q.combo_booking
@@ -4765,17 +5065,16 @@ def quotation_detail(request, quotation_id):
             if payment_amount <= 0:
                 payment_amount = quote_total if quote_total > 0 else Decimal('0.01')
 
-        QuotationPayment.objects.create(
+        new_pay = QuotationPayment.objects.create(
             quotation=q,
             payment_type='total' if payment_type == 'total' else 'parcial',
             amount=payment_amount,
             proof=proof_file,
             created_by=request.user,
         )
-        # Campo legado: apunta al último comprobante en storage
-        last_pay = q.payments.order_by('-created_at', '-id').first()
-        if last_pay and last_pay.proof:
-            q.payment_proof = last_pay.proof.name
+        # Campo legado: apunta al último comprobante en storage (el recién creado)
+        if new_pay.proof:
+            q.payment_proof = new_pay.proof.name
             q.save(update_fields=['payment_proof', 'updated_at'])
         paid_now = q.sync_payment_totals(save=True)
 
@@ -4786,14 +5085,12 @@ def quotation_detail(request, quotation_id):
         ):
             _deduct_stock_for_quotation(q)
 
+        # El aviso por WhatsApp (webhook n8n) no bloquea la respuesta
         if new_status == 'pago_recibido' and previous_status != 'pago_recibido':
-            _notify_wa_quotation_payment(q, event='pago_recibido', request=request)
+            wa_event = 'pago_recibido'
         else:
-            _notify_wa_quotation_payment(
-                q,
-                event='pago_parcial' if new_status == 'pago_parcial' else 'referencia',
-                request=request,
-            )
+            wa_event = 'pago_parcial' if new_status == 'pago_parcial' else 'referencia'
+        _enqueue_wa_quotation_payment(q, event=wa_event, request=request)
 
         if new_status == 'pago_parcial':
             messages.success(
@@ -4814,13 +5111,11 @@ def quotation_detail(request, quotation_id):
     if request.method == 'POST' and request.user.is_authenticated and request.user.is_staff:
         qs = (request.POST.get('quotation_status') or '').strip()
         os_ = (request.POST.get('order_status') or '').strip()
-        allowed_qs = {c[0] for c in getattr(Quotation, 'QUOTATION_STATUS_CHOICES', [])}
-        allowed_os = {c[0] for c in getattr(Quotation, 'ORDER_STATUS_CHOICES', [])}
         changed = False
-        if qs and qs in allowed_qs and qs != q.quotation_status:
+        if qs and qs in _ALLOWED_QUOTATION_STATUSES and qs != q.quotation_status:
             q.quotation_status = qs
             changed = True
-        if os_ and os_ in allowed_os and os_ != q.order_status:
+        if os_ and os_ in _ALLOWED_ORDER_STATUSES and os_ != q.order_status:
             post_payment_statuses = _post_payment_statuses()
             if os_ in post_payment_statuses and not q.payment_proof:
                 messages.warning(request, 'Debe subir una referencia de pago antes de marcar este estado de pedido.')
@@ -4850,24 +5145,16 @@ def quotation_detail(request, quotation_id):
             messages.info(request, 'Inventario actualizado según productos aceptados.')
         return redirect('store:quotation_detail', quotation_id=q.id)
 
-    def split_iva(amount: Decimal):
-        if amount is None:
-            amount = Decimal('0.00')
-        base = (amount / (Decimal('1.00') + IVA_RATE))
-        iva = amount - base
-        return base, iva
-
     total_base = Decimal('0.00')
     total_iva = Decimal('0.00')
     for it in items:
-        it.base_unit, it.iva_unit = split_iva(it.unit_price)
-        it.base_subtotal, it.iva_subtotal = split_iva(it.subtotal)
-        # descuento si aplica (precio original - precio actual)
-        try:
-            it.original_unit_price = it.product.price
-            it.discount_unit = (it.original_unit_price - it.unit_price) if it.product.has_discount else Decimal('0.00')
-        except Exception:
-            it.original_unit_price = it.unit_price
+        # descuento si aplica (precio original - precio actual); líneas sin producto no tienen
+        product = it.product
+        if product is not None and product.has_discount:
+            it.original_unit_price = product.price
+            it.discount_unit = product.price - it.unit_price
+        else:
+            it.original_unit_price = product.price if product is not None else it.unit_price
             it.discount_unit = Decimal('0.00')
 
         total_base += it.base_subtotal
@@ -4916,10 +5203,11 @@ def _infer_quotation_list_unit_price(product, unit_price) -> Decimal:
     if not product:
         return unit
     if getattr(product, 'is_rental', False) or getattr(product, 'product_type', '') == 'rental':
+        # all() aprovecha el prefetch de product__rental_prices en el PDF
         tariffs = [
             rp.price
-            for rp in product.rental_prices.filter(is_active=True)
-            if rp.price is not None
+            for rp in product.rental_prices.all()
+            if rp.is_active and rp.price is not None
         ]
         if tariffs:
             above = [t for t in tariffs if t >= unit]
@@ -4940,37 +5228,26 @@ def _normalize_pdf_iva_mode(raw) -> str:
 
 def _quotation_pdf_context(quote: Quotation, iva_mode: str = 'with_iva', doc_type: str = 'cotizacion') -> dict:
     """Shared context for quotation PDF HTML / xhtml2pdf."""
-    quote.sync_client_snapshot_from_profile(save=True)
     show_iva = _normalize_pdf_iva_mode(iva_mode) == 'with_iva'
     is_factura = (doc_type or 'cotizacion') == 'factura'
     is_paid = _quotation_is_fully_paid(quote) or quote.order_status in _fully_paid_statuses()
-    items = quote.items.select_related('product', 'product__category').prefetch_related(
-        'product__rental_prices'
-    ).all()
+    items = quote.items.select_related('product', 'product__category', 'rental_price').only(
+        *_QUOTE_ITEM_DISPLAY_FIELDS
+    ).prefetch_related('product__rental_prices')
     expires_at = quote.created_at + timedelta(days=1)
 
-    def split_iva(amount: Decimal):
-        if amount is None:
-            amount = Decimal('0.00')
-        base = (amount / (Decimal('1.00') + IVA_RATE))
-        iva = amount - base
-        return base, iva
-
-    total_base = Decimal('0.00')
-    total_iva = Decimal('0.00')
+    total_base = _ZERO
+    total_iva = _ZERO
     for it in items:
-        it.base_unit, it.iva_unit = split_iva(it.unit_price)
-        it.base_subtotal, it.iva_subtotal = split_iva(it.subtotal)
-        try:
-            list_price = it.list_unit_price
-            if list_price is None:
-                list_price = _infer_quotation_list_unit_price(it.product, it.unit_price)
-            it.original_unit_price = list_price
-            diff = list_price - it.unit_price
-            it.discount_unit = diff if diff > 0 else Decimal('0.00')
-        except Exception:
-            it.original_unit_price = it.unit_price
-            it.discount_unit = Decimal('0.00')
+        it.base_unit, it.iva_unit = _split_iva(it.unit_price)
+        it.base_subtotal, it.iva_subtotal = _split_iva(it.subtotal)
+        unit = it.unit_price if it.unit_price is not None else _ZERO
+        list_price = it.list_unit_price
+        if list_price is None:
+            # Líneas antiguas sin precio de lista guardado (product viene del select_related)
+            list_price = _infer_quotation_list_unit_price(it.product if it.product_id else None, unit)
+        it.original_unit_price = list_price
+        it.discount_unit = list_price - unit if list_price > unit else _ZERO
         total_base += it.base_subtotal
         total_iva += it.iva_subtotal
 
@@ -4991,80 +5268,231 @@ def _quotation_pdf_context(quote: Quotation, iva_mode: str = 'with_iva', doc_typ
     }
 
 
+@lru_cache(maxsize=512)
+def _resolve_pdf_local_path(path_only: str):
+    """
+    Ruta en disco de un asset /static/ o /media/ para xhtml2pdf, memoizada por proceso.
+    En producción se usa STATIC_ROOT (collectstatic) y solo se recorren los finders si falta el archivo.
+    """
+    static_url = settings.STATIC_URL or '/static/'
+    media_url = settings.MEDIA_URL or '/media/'
+    if path_only.startswith(media_url):
+        return os.path.join(settings.MEDIA_ROOT, path_only[len(media_url):].lstrip('/'))
+    if path_only.startswith('/media/'):
+        return os.path.join(settings.MEDIA_ROOT, path_only[len('/media/'):])
+    if path_only.startswith(static_url):
+        rel_name = path_only[len(static_url):]
+    elif path_only.startswith('/static/'):
+        rel_name = path_only[len('/static/'):]
+    else:
+        return path_only
+    if not settings.DEBUG and settings.STATIC_ROOT:
+        collected = os.path.join(settings.STATIC_ROOT, rel_name)
+        if os.path.isfile(collected):
+            return collected
+    path = finders.find(rel_name)
+    if isinstance(path, (list, tuple)):
+        path = path[0] if path else None
+    return path
+
+
 def _pdf_link_callback(uri, rel):
     """Resolve static/media URIs for xhtml2pdf (incluye URLs públicas de Supabase)."""
-    from django.conf import settings
-    from django.contrib.staticfiles import finders
-    from urllib.parse import unquote, urlparse
-    import tempfile
-
     raw = unquote(uri or '')
     parsed = urlparse(raw)
 
     # URL absoluta (Supabase Storage u otra CDN)
     if parsed.scheme in ('http', 'https'):
         try:
-            import requests
-            resp = requests.get(raw, timeout=20)
-            resp.raise_for_status()
-            suffix = os.path.splitext(parsed.path)[1] or '.bin'
-            fd, tmp_path = tempfile.mkstemp(prefix='pdfimg_', suffix=suffix)
-            with os.fdopen(fd, 'wb') as fh:
-                fh.write(resp.content)
-            return tmp_path
+            return _pdf_remote_asset(raw, parsed)
         except Exception:
             return uri
 
     path_only = parsed.path or raw
 
-    if path_only.startswith(settings.MEDIA_URL):
+    if path_only.startswith(settings.MEDIA_URL) and getattr(settings, 'USE_SUPABASE_MEDIA', False):
         # Si media está en Supabase, reconstruir URL pública
-        rel_name = path_only.replace(settings.MEDIA_URL, '', 1).lstrip('/')
+        rel_name = path_only[len(settings.MEDIA_URL):].lstrip('/')
         supabase_url = getattr(settings, 'SUPABASE_URL', '') or ''
         bucket = getattr(settings, 'SUPABASE_STORAGE_BUCKET', '') or ''
-        if supabase_url and bucket and getattr(settings, 'USE_SUPABASE_MEDIA', False):
+        if supabase_url and bucket:
             return _pdf_link_callback(
                 f'{supabase_url.rstrip("/")}/storage/v1/object/public/{bucket}/{rel_name}',
                 rel,
             )
-        path = os.path.join(settings.MEDIA_ROOT, rel_name)
-    elif path_only.startswith(settings.STATIC_URL):
-        path = finders.find(path_only.replace(settings.STATIC_URL, '', 1))
-    elif path_only.startswith('/static/'):
-        path = finders.find(path_only.replace('/static/', '', 1))
-    elif path_only.startswith('/media/'):
-        path = os.path.join(settings.MEDIA_ROOT, path_only.replace('/media/', '', 1))
-    else:
-        path = path_only
-    if not path:
-        return uri
-    if isinstance(path, (list, tuple)):
-        path = path[0]
+    path = _resolve_pdf_local_path(path_only)
+    return _pdf_image_variant(path) if path else uri
+
+
+# Lado mayor de las imágenes incrustadas en PDFs: el logo mide 78px y las miniaturas 34-48px,
+# así que 400px conserva nitidez al imprimir sin arrastrar la resolución original.
+_PDF_IMAGE_MAX_PX = 400
+_PDF_RASTER_EXTS = frozenset({'.png', '.jpg', '.jpeg', '.webp'})
+
+
+def _pdf_image_variant(path: str) -> str:
+    """
+    Copia reducida de una imagen local para xhtml2pdf, o la ruta original si no hace falta.
+    reportlab vuelve a comprimir todos los píxeles de cada imagen en cada render; con el logo
+    a resolución completa ese paso era cerca de la mitad del tiempo del PDF de cotización.
+    """
+    if os.path.splitext(path)[1].lower() not in _PDF_RASTER_EXTS:
+        return path
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path
+    return _pdf_image_variant_for(path, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=256)
+def _pdf_image_variant_for(path: str, mtime_ns: int, size: int) -> str:
+    """Genera (una vez por archivo y versión) la copia reducida en el cache de PDFs."""
+    digest = hashlib.sha1(f'{path}:{mtime_ns}:{size}:{_PDF_IMAGE_MAX_PX}'.encode()).hexdigest()[:20]
+    try:
+        return _downscale_pdf_image(path, digest) or path
+    except Exception:
+        logger.exception('No se pudo reducir la imagen %s para el PDF', path)
+        return path
+
+
+def _downscale_pdf_image(path: str, name: str, *, reuse: bool = True):
+    """
+    Escribe en assets/ la copia reducida de path con el nombre dado y devuelve su ruta,
+    o None si la imagen ya cabe en _PDF_IMAGE_MAX_PX.
+    """
+    from PIL import Image
+
+    with Image.open(path) as im:
+        if max(im.size) <= _PDF_IMAGE_MAX_PX:
+            return None
+        has_alpha = im.mode in ('RGBA', 'LA', 'P', 'PA')
+        target = os.path.join(_pdf_cache_folder('assets'), f'{name}.{"png" if has_alpha else "jpg"}')
+        if reuse and os.path.isfile(target):
+            return target
+        img = im.convert('RGBA' if has_alpha else 'RGB')
+        img.thumbnail((_PDF_IMAGE_MAX_PX, _PDF_IMAGE_MAX_PX))
+        tmp_target = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+        if has_alpha:
+            img.save(tmp_target, 'PNG', optimize=True)
+        else:
+            img.save(tmp_target, 'JPEG', quality=88)
+        os.replace(tmp_target, target)
+        return target
+
+
+def _pdf_remote_asset(url: str, parsed) -> str:
+    """
+    Copia local (reducida si es imagen) de un asset remoto para xhtml2pdf.
+    Se guarda en assets/ con una clave fija por URL y su ETag; en los siguientes renders
+    se pide con If-None-Match y un 304 reutiliza el archivo sin descargarlo de nuevo.
+    """
+    folder = _pdf_cache_folder('assets')
+    key = 'remote-' + hashlib.sha1(url.encode()).hexdigest()[:20]
+    meta_path = os.path.join(folder, f'{key}.json')
+    meta = {}
+    try:
+        with open(meta_path, encoding='utf-8') as fh:
+            meta = json.load(fh)
+    except (OSError, ValueError):
+        pass
+    cached_path = meta.get('path') if meta.get('path') and os.path.isfile(meta['path']) else None
+
+    headers = {'If-None-Match': meta['etag']} if cached_path and meta.get('etag') else {}
+    resp = requests.get(url, headers=headers, timeout=20)
+    if resp.status_code == 304 and cached_path:
+        return cached_path
+    resp.raise_for_status()
+
+    suffix = os.path.splitext(parsed.path)[1].lower() or '.bin'
+    fd, tmp_path = tempfile.mkstemp(prefix='pdfimg_', suffix=suffix, dir=folder)
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(resp.content)
+        variant = None
+        if suffix in _PDF_RASTER_EXTS:
+            try:
+                variant = _downscale_pdf_image(tmp_path, key, reuse=False)
+            except Exception:
+                logger.exception('No se pudo reducir la imagen remota %s para el PDF', url)
+        if variant:
+            path = variant
+        else:
+            path = os.path.join(folder, f'{key}{suffix}')
+            os.replace(tmp_path, path)
+    finally:
+        # La descarga cruda solo se conserva si se usó tal cual (ya renombrada)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if cached_path and cached_path != path:
+        try:
+            os.remove(cached_path)
+        except OSError:
+            pass
+    try:
+        with open(meta_path, 'w', encoding='utf-8') as fh:
+            json.dump({'etag': resp.headers.get('ETag') or '', 'path': path}, fh)
+    except OSError:
+        pass
     return path
 
 
 def _quotation_pdf_cache_path(quote: Quotation, iva_mode: str = 'with_iva', doc_type: str = 'cotizacion') -> str:
     """Disk cache path for generated quotation PDF (local media o /tmp en serverless)."""
-    from django.conf import settings
-
     mode = _normalize_pdf_iva_mode(iva_mode)
     kind = 'fac' if doc_type == 'factura' else 'cot'
     paid = 'pagado' if _quotation_is_fully_paid(quote) or quote.order_status in _fully_paid_statuses() else 'abierto'
     stamp = quote.updated_at.strftime('%Y%m%d%H%M%S') if quote.updated_at else '0'
-    folder = str(getattr(settings, 'PDF_CACHE_ROOT', None) or os.path.join(settings.MEDIA_ROOT, 'quotations', 'pdf_cache'))
+    return os.path.join(_pdf_cache_folder(), f'COT{quote.id}-{stamp}-{mode}-{kind}-{paid}.pdf')
+
+
+def _pdf_cache_folder(*parts) -> str:
+    """Carpeta del cache de PDFs (local media o /tmp en serverless), creada si no existe."""
+    root = str(getattr(settings, 'PDF_CACHE_ROOT', None) or os.path.join(settings.MEDIA_ROOT, 'quotations', 'pdf_cache'))
+    folder = os.path.join(root, *parts)
     try:
         os.makedirs(folder, exist_ok=True)
     except OSError:
         # Último recurso en entornos read-only
-        folder = os.path.join('/tmp', 'frozz_pdf_cache')
+        folder = os.path.join('/tmp', 'frozz_pdf_cache', *parts)
         os.makedirs(folder, exist_ok=True)
-    return os.path.join(folder, f'COT{quote.id}-{stamp}-{mode}-{kind}-{paid}.pdf')
+    return folder
+
 
+# PDFs más grandes no se copian al cache compartido (evita llenar Redis con adjuntos pesados)
+_PDF_BYTES_CACHE_MAX_SIZE = 5 * 1024 * 1024
 
-def _build_quotation_pdf_bytes(quote: Quotation, iva_mode: str = 'with_iva', doc_type: str = 'cotizacion'):
-    """Generate PDF bytes with xhtml2pdf (cached by quote.updated_at + iva mode). Returns (bytes|None, error)."""
+
+def _open_cached_quotation_pdf(cache_path: str):
+    """Abre el PDF cacheado en disco (posicionado al inicio) o None si no existe / no es válido."""
+    try:
+        fh = open(cache_path, 'rb')
+    except OSError:
+        return None
+    if fh.read(4) != b'%PDF':
+        fh.close()
+        return None
+    fh.seek(0)
+    return fh
+
+
+def _build_quotation_pdf_bytes(
+    quote: Quotation,
+    iva_mode: str = 'with_iva',
+    doc_type: str = 'cotizacion',
+    sync_snapshot: bool = True,
+):
+    """
+    Generate PDF bytes with xhtml2pdf (cached by quote.updated_at + iva mode). Returns (bytes|None, error).
+    sync_snapshot=False cuando quien llama ya sincronizó el snapshot del cliente.
+    """
     mode = _normalize_pdf_iva_mode(iva_mode)
     kind = 'factura' if doc_type == 'factura' else 'cotizacion'
+    # Sincronizar antes de calcular la ruta: si el snapshot mueve updated_at, el PDF queda
+    # guardado con la marca final y el visor / Telegram reutilizan el mismo archivo.
+    if sync_snapshot:
+        quote.sync_client_snapshot_from_profile(save=True)
     cache_path = _quotation_pdf_cache_path(quote, mode, kind)
     try:
         if os.path.isfile(cache_path):
@@ -5075,15 +5503,22 @@ def _build_quotation_pdf_bytes(quote: Quotation, iva_mode: str = 'with_iva', doc
     except OSError:
         pass
 
+    # Otra instancia (serverless) pudo generarlo ya: la clave incluye id, updated_at, modo y estado
+    shared_timeout = getattr(settings, 'PDF_BYTES_CACHE_TIMEOUT', 0)
+    shared_key = f'qpdf:{os.path.basename(cache_path)}'
+    if shared_timeout:
+        data = cache.get(shared_key)
+        if data:
+            _store_quotation_pdf_on_disk(quote, cache_path, data)
+            return data, None
+
     try:
-        from django.template.loader import get_template
         from xhtml2pdf import pisa
-        from io import BytesIO
     except ImportError:
         return None, 'xhtml2pdf no está instalado'
 
-    template = get_template('store/quotation_pdf.html')
-    html = template.render(_quotation_pdf_context(quote, iva_mode=mode, doc_type=kind))
+    # get_template pasa por el cached loader de TEMPLATES, que en DEBUG se limpia al editar la plantilla
+    html = get_template('store/quotation_pdf.html').render(_quotation_pdf_context(quote, iva_mode=mode, doc_type=kind))
     result = BytesIO()
     pdf = pisa.pisaDocument(
         BytesIO(html.encode('utf-8')),
@@ -5094,6 +5529,14 @@ def _build_quotation_pdf_bytes(quote: Quotation, iva_mode: str = 'with_iva', doc
     if pdf.err:
         return None, f'Error generando PDF: {pdf.err}'
     data = result.getvalue()
+    if shared_timeout and len(data) < _PDF_BYTES_CACHE_MAX_SIZE:
+        cache.set(shared_key, data, shared_timeout)
+    _store_quotation_pdf_on_disk(quote, cache_path, data)
+    return data, None
+
+
+def _store_quotation_pdf_on_disk(quote: Quotation, cache_path: str, data: bytes) -> None:
+    """Guarda el PDF en el cache en disco y borra las versiones anteriores de la cotización."""
     try:
         # Limpia caches viejos de esta cotización (ambos modos)
         folder = os.path.dirname(cache_path)
@@ -5109,7 +5552,17 @@ def _build_quotation_pdf_bytes(quote: Quotation, iva_mode: str = 'with_iva', doc
             fh.write(data)
     except OSError:
         logger.exception('No se pudo cachear PDF de cotización %s', quote.id)
-    return data, None
+
+
+@lru_cache(maxsize=1024)
+def _client_file_slug(client_name: str) -> str:
+    """Nombre del cliente apto para nombres de archivo (memoizado: se repite en cada PDF)."""
+    return slugify(client_name or 'sin-cliente')[:40]
+
+
+def _quotation_file_label(quote: Quotation) -> str:
+    """'{id}-{fecha}-{cliente}' común a los nombres de archivo de la cotización."""
+    return f'{quote.id}-{quote.created_at:%Y-%m-%d}-{_client_file_slug(quote.client_name)}'
 
 
 @xframe_options_sameorigin
@@ -5119,10 +5572,9 @@ def quotation_pdf(request, quotation_id):
     iva_mode = _normalize_pdf_iva_mode(request.GET.get('iva'))
     iva_qs = '1' if iva_mode == 'with_iva' else '0'
     doc_type = 'factura' if str(request.GET.get('tipo') or '').lower() in ('factura', 'invoice', 'fac') else 'cotizacion'
-    safe_client = slugify(q.client_name or 'sin-cliente')[:40]
     mode_label = 'con-iva' if iva_mode == 'with_iva' else 'sin-iva'
     prefix = 'FAC' if doc_type == 'factura' else 'COT'
-    filename = f"{prefix}{q.id}-{q.created_at.strftime('%Y-%m-%d')}-{safe_client}-{mode_label}.pdf"
+    filename = f"{prefix}{_quotation_file_label(q)}-{mode_label}.pdf"
     file_url = (
         reverse('store:quotation_pdf_file', kwargs={'quotation_id': q.id})
         + f'?iva={iva_qs}&tipo={"factura" if doc_type == "factura" else "cotizacion"}'
@@ -5158,7 +5610,35 @@ def quotation_pdf_file(request, quotation_id):
             content_type='text/plain; charset=utf-8',
             status=403,
         )
-    pdf_bytes, err = _build_quotation_pdf_bytes(q, iva_mode=iva_mode, doc_type=doc_type)
+    # Snapshot del cliente al día antes de armar el nombre del archivo y la ruta del cache
+    q.sync_client_snapshot_from_profile(save=True)
+    mode_label = 'con-iva' if iva_mode == 'with_iva' else 'sin-iva'
+    prefix = 'FAC' if doc_type == 'factura' else 'COT'
+    filename = f"{prefix}{_quotation_file_label(q)}-{mode_label}.pdf"
+    as_download = str(request.GET.get('download') or '') in ('1', 'true', 'yes')
+
+    # PDF ya generado: se envía por bloques desde el cache en disco, sin cargarlo completo en memoria
+    cache_path = _quotation_pdf_cache_path(q, iva_mode, doc_type)
+    cached_fh = _open_cached_quotation_pdf(cache_path)
+    pdf_bytes = err = None
+    if cached_fh is None:
+        pdf_bytes, err = _build_quotation_pdf_bytes(q, iva_mode=iva_mode, doc_type=doc_type, sync_snapshot=False)
+        if pdf_bytes:
+            # Recién escrito en disco: se sirve por el mismo camino y se sueltan los bytes en memoria
+            cached_fh = _open_cached_quotation_pdf(cache_path)
+            if cached_fh is not None:
+                pdf_bytes = None
+    if cached_fh is not None:
+        response = FileResponse(
+            cached_fh,
+            content_type='application/pdf',
+            as_attachment=as_download,
+            filename=filename,
+        )
+        response['Cache-Control'] = 'private, max-age=60'
+        response['X-Frame-Options'] = 'SAMEORIGIN'
+        return response
+
     if not pdf_bytes:
         # Evitar HTML (con X-Frame-Options deny / redirects) dentro del iframe del visor.
         msg = err or 'No se pudo generar el PDF'
@@ -5171,11 +5651,6 @@ def quotation_pdf_file(request, quotation_id):
             status=500,
         )
 
-    safe_client = slugify(q.client_name or 'sin-cliente')[:40]
-    mode_label = 'con-iva' if iva_mode == 'with_iva' else 'sin-iva'
-    prefix = 'FAC' if doc_type == 'factura' else 'COT'
-    filename = f"{prefix}{q.id}-{q.created_at.strftime('%Y-%m-%d')}-{safe_client}-{mode_label}.pdf"
-    as_download = str(request.GET.get('download') or '') in ('1', 'true', 'yes')
     response = HttpResponse(pdf_bytes, content_type='application/pdf')
     disposition = 'attachment' if as_download else 'inline'
     response['Content-Disposition'] = f'{disposition}; filename="{filename}"'
@@ -5199,24 +5674,33 @@ def quotation_invoice_download(request, quotation_id):
     )
 
 
-def _quotation_rental_items(quote: Quotation):
-    return list(
+def _quotation_rental_items(quote: Quotation, prefetch_tariffs: bool = False):
+    """Líneas de alquiler; prefetch_tariffs carga product.active_rental_prices en una sola consulta."""
+    items = (
         quote.items.select_related('product', 'product__category', 'rental_price')
         .filter(product__product_type='rental')
         .order_by('id')
     )
+    if prefetch_tariffs:
+        items = items.prefetch_related(Prefetch(
+            'product__rental_prices',
+            queryset=ProductRentalPrice.objects.filter(is_active=True).order_by('order', 'period_type'),
+            to_attr='active_rental_prices',
+        ))
+    return list(items)
 
 
 def _rental_contract_context(quote: Quotation) -> dict:
     """Context for rental equipment contract PDF."""
     quote.sync_client_snapshot_from_profile(save=True)
     settings_obj = SiteSettings.load()
-    rental_items = _quotation_rental_items(quote)
+    # Tarifas activas de todas las máquinas en una sola consulta (no una por línea)
+    rental_items = _quotation_rental_items(quote, prefetch_tariffs=True)
     equipment = []
     deposit_examples = []
     for it in rental_items:
         p = it.product
-        tariffs = list(p.rental_prices.filter(is_active=True).order_by('order', 'period_type'))
+        tariffs = p.active_rental_prices
         commercial = p.rental_commercial_value
         deposit_8pct = None
         if commercial is not None and commercial > 0:
@@ -5247,13 +5731,11 @@ def _rental_contract_context(quote: Quotation) -> dict:
 
 def _build_rental_contract_pdf_bytes(quote: Quotation):
     """Generate rental contract PDF for quotation rental lines."""
-    if not _quotation_rental_items(quote):
+    if not quote.has_rental_items:
         return None, 'Esta cotización no incluye máquinas de alquiler.'
 
     try:
-        from django.template.loader import get_template
         from xhtml2pdf import pisa
-        from io import BytesIO
     except ImportError:
         return None, 'xhtml2pdf no está instalado'
 
@@ -5285,8 +5767,7 @@ def quotation_rental_contract(request, quotation_id):
         messages.error(request, err or 'No se pudo generar el contrato.')
         return redirect('store:quotation_detail', quotation_id=q.id)
 
-    safe_client = slugify(q.client_name or 'sin-cliente')[:40]
-    filename = f"CONTRATO-ALQUILER-COT{q.id}-{q.created_at.strftime('%Y-%m-%d')}-{safe_client}.pdf"
+    filename = f"CONTRATO-ALQUILER-COT{_quotation_file_label(q)}.pdf"
     response = HttpResponse(pdf_bytes, content_type='application/pdf')
     disposition = 'attachment' if as_download else 'inline'
     response['Content-Disposition'] = f'{disposition}; filename="{filename}"'
@@ -6200,9 +6681,7 @@ def _delivery_acta_pdf_context(quote: Quotation, acta: RentalDeliveryActa) -> di
 def _build_delivery_acta_pdf_bytes(quote: Quotation, acta: RentalDeliveryActa):
     """Generate delivery reception acta PDF with photos and signatures."""
     try:
-        from django.template.loader import get_template
         from xhtml2pdf import pisa
-        from io import BytesIO
     except ImportError:
         return None, 'xhtml2pdf no está instalado'
 
@@ -6236,7 +6715,7 @@ def quotation_delivery_acta_pdf(request, quotation_id):
         messages.error(request, err or 'No se pudo generar el acta.')
         return redirect('store:quotation_detail', quotation_id=q.id)
 
-    safe_client = slugify(q.client_name or 'sin-cliente')[:40]
+    safe_client = _client_file_slug(q.client_name)
     stamp = (acta.completed_at or acta.updated_at or timezone.now()).strftime('%Y-%m-%d')
     filename = f"ACTA-RECEPCION-COT{q.id}-{stamp}-{safe_client}.pdf"
     response = HttpResponse(pdf_bytes, content_type='application/pdf')
@@ -6289,7 +6768,6 @@ def _absolute_url(path_or_url: str, request=None) -> str:
             return request.build_absolute_uri(value)
         except Exception:
             pass
-    from django.conf import settings
     base = getattr(settings, 'SITE_URL', '') or ''
     if base:
         return base.rstrip('/') + '/' + value.lstrip('/')
@@ -6496,7 +6974,6 @@ def _notify_whatsapp_n8n(*, message: str, link: str = '', phone: str = '', reque
         payload['link'] = absolute_link
 
     try:
-        import requests
         resp = requests.post(webhook, json=payload, timeout=12)
         logger.info(
             '[WA-N8N] POST %s status=%s phone=%s has_link=%s',
@@ -6546,7 +7023,45 @@ def _notify_wa_new_quotation(quote: Quotation, *, source: str = '', request=None
     _notify_whatsapp_n8n(message=message, link='', request=request)
 
 
-def _notify_wa_quotation_payment(quote: Quotation, *, event: str = 'referencia', request=None) -> None:
+def _wa_quotation_payment_link(quote: Quotation, request=None) -> str:
+    """Enlace absoluto del aviso de pago: el comprobante si existe, si no el detalle."""
+    link = ''
+    if request is not None:
+        try:
+            link = request.build_absolute_uri(reverse('store:quotation_detail', kwargs={'quotation_id': quote.id}))
+        except Exception:
+            link = f"/cotizaciones/{quote.id}/"
+        if quote.payment_proof:
+            try:
+                link = request.build_absolute_uri(quote.payment_proof.url)
+            except Exception:
+                link = getattr(quote.payment_proof, 'url', link) or link
+    else:
+        link = f"/cotizaciones/{quote.id}/"
+    return _absolute_url(link, request=request)
+
+
+def _enqueue_wa_quotation_payment(quote: Quotation, *, event: str, request=None) -> None:
+    """
+    Programa el aviso de pago tras el commit. Al hilo solo viajan el id y el
+    enlace ya resuelto: ni la instancia ni el request cruzan a otro hilo.
+    """
+    quote_id = quote.id
+    link = _wa_quotation_payment_link(quote, request=request)
+    transaction.on_commit(
+        lambda: _run_in_background(_notify_wa_quotation_payment_by_id, quote_id, event=event, link=link)
+    )
+
+
+def _notify_wa_quotation_payment_by_id(quote_id: int, *, event: str, link: str) -> None:
+    """Recarga la cotización en el hilo de fondo (su conexión se cierra en _run_in_background)."""
+    quote = Quotation.objects.select_related('existing_client__profile').filter(id=quote_id).first()
+    if quote is None:
+        return
+    _notify_wa_quotation_payment(quote, event=event, link=link)
+
+
+def _notify_wa_quotation_payment(quote: Quotation, *, event: str = 'referencia', request=None, link: str = '') -> None:
     """WhatsApp: pago / referencia de cotización (formato minimalista)."""
     quote.sync_client_snapshot_from_profile(save=True)
     if event == 'pago_recibido':
@@ -6569,21 +7084,8 @@ def _notify_wa_quotation_payment(quote: Quotation, *, event: str = 'referencia',
     elif event == 'pago_recibido':
         lines.append('Pago: Total')
 
-    link = ''
-    if request is not None:
-        try:
-            link = request.build_absolute_uri(reverse('store:quotation_detail', kwargs={'quotation_id': quote.id}))
-        except Exception:
-            link = f"/cotizaciones/{quote.id}/"
-        if quote.payment_proof:
-            try:
-                link = request.build_absolute_uri(quote.payment_proof.url)
-            except Exception:
-                link = getattr(quote.payment_proof, 'url', link) or link
-    else:
-        link = f"/cotizaciones/{quote.id}/"
-
-    message = _wa_build_message(title, lines, link=_absolute_url(link, request=request))
+    link = link or _wa_quotation_payment_link(quote, request=request)
+    message = _wa_build_message(title, lines, link=link)
     _notify_whatsapp_n8n(message=message, link='', request=request)
 
 
@@ -6698,9 +7200,60 @@ def _notify_wa_finance_record(record: FinanceRecord, request=None) -> None:
     _notify_whatsapp_n8n(message=message, link='', request=request)
 
 
-def _notify_telegram_new_quotation(quote: Quotation, is_registered: bool) -> None:
-    """Envía alerta a Telegram con datos de la cotización y el PDF adjunto. Requiere TELEGRAM_BOT_TOKEN y TELEGRAM_CHAT_ID en settings."""
-    from django.conf import settings
+def _run_in_background(func, *args, **kwargs) -> None:
+    """
+    Ejecuta func en un hilo daemon para no bloquear la respuesta HTTP.
+    Si BACKGROUND_NOTIFICATIONS está desactivado (serverless), se ejecuta en línea.
+    """
+    if not getattr(settings, 'BACKGROUND_NOTIFICATIONS', False):
+        func(*args, **kwargs)
+        return
+
+    def _target():
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            logger.exception("[BACKGROUND] Error ejecutando %s", getattr(func, '__name__', func))
+        finally:
+            # Cada hilo abre su propia conexión a BD; cerrarla al terminar
+            connection.close()
+
+    threading.Thread(target=_target, daemon=True).start()
+
+
+@lru_cache(maxsize=None)
+def _telegram_session():
+    """Sesión HTTP reutilizable hacia api.telegram.org: mantiene la conexión TLS entre avisos."""
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return session
+
+
+def _enqueue_telegram_new_quotation(quote_id: int, is_registered: bool) -> None:
+    """
+    Programa el aviso de Telegram (texto + PDF) para después del commit.
+    El render del PDF (xhtml2pdf) es lo más costoso del checkout, así que nunca corre
+    dentro de la transacción y, con BACKGROUND_NOTIFICATIONS, tampoco en la respuesta.
+    """
+    transaction.on_commit(
+        lambda: _run_in_background(_notify_telegram_new_quotation_by_id, quote_id, is_registered)
+    )
+
+
+def _notify_telegram_new_quotation_by_id(quote_id: int, is_registered: bool) -> None:
+    """Recarga la cotización en el hilo de trabajo (ya confirmada) y envía el aviso."""
+    quote = Quotation.objects.select_related('existing_client__profile').filter(id=quote_id).first()
+    if quote is None:
+        logger.warning("[TELEGRAM] Cotización %s no encontrada; no se enviará aviso", quote_id)
+        return
+    _notify_telegram_new_quotation(quote, is_registered)
+
+
+def _notify_telegram_new_quotation(quote: Quotation, is_registered: bool, pdf_bytes: bytes = None) -> None:
+    """
+    Envía alerta a Telegram con datos de la cotización y el PDF adjunto. Requiere TELEGRAM_BOT_TOKEN y TELEGRAM_CHAT_ID en settings.
+    Si ya se tienen los bytes del PDF se reutilizan; si no, se toman del cache en disco o se generan una vez.
+    """
     token = getattr(settings, 'TELEGRAM_BOT_TOKEN', None)
     chat_id = getattr(settings, 'TELEGRAM_CHAT_ID', None)
     logger.info(
@@ -6713,10 +7266,11 @@ def _notify_telegram_new_quotation(quote: Quotation, is_registered: bool) -> Non
         logger.warning("[TELEGRAM] Falta TELEGRAM_BOT_TOKEN o TELEGRAM_CHAT_ID; no se enviará mensaje")
         return
     try:
-        import requests
+        session = _telegram_session()
     except Exception:
         logger.exception("[TELEGRAM] No se pudo importar requests; omitiendo notificación")
         return
+    api_base = f"https://api.telegram.org/bot{token}"
 
     tipo = 'Registrado' if is_registered and quote.existing_client_id else 'Invitado / Anónimo'
     lineas = [
@@ -6736,8 +7290,8 @@ def _notify_telegram_new_quotation(quote: Quotation, is_registered: bool) -> Non
     # Enviar mensaje de texto primero
     try:
         logger.info("[TELEGRAM] Enviando mensaje a chat_id=%r", chat_id)
-        resp = requests.post(
-            f"https://api.telegram.org/bot{token}/sendMessage",
+        resp = session.post(
+            f"{api_base}/sendMessage",
             json={
                 'chat_id': chat_id,
                 'text': text,
@@ -6756,30 +7310,34 @@ def _notify_telegram_new_quotation(quote: Quotation, is_registered: bool) -> Non
 
     # Generar y enviar PDF
     try:
-        from io import BytesIO
-
-        pdf_bytes, err = _build_quotation_pdf_bytes(quote)
-        if not pdf_bytes:
-            logger.warning("[TELEGRAM] No se pudo generar PDF: %s", err)
-            return
-
-        safe_client = slugify(quote.client_name or 'sin-cliente')[:40]
-        safe_date = quote.created_at.strftime('%Y-%m-%d')
-        filename = f"COT{quote.id}-{safe_date}-{safe_client}.pdf"
+        document = BytesIO(pdf_bytes) if pdf_bytes else None
+        if document is None:
+            pdf_bytes, err = _build_quotation_pdf_bytes(quote)
+            if not pdf_bytes:
+                logger.warning("[TELEGRAM] No se pudo generar PDF: %s", err)
+                return
+            # Ya quedó en el cache en disco: se adjunta el archivo y se sueltan los bytes en memoria
+            document = _open_cached_quotation_pdf(_quotation_pdf_cache_path(quote)) or BytesIO(pdf_bytes)
+            pdf_bytes = None
+
+        filename = f"COT{_quotation_file_label(quote)}.pdf"
 
         # Enviar PDF como documento
-        logger.info("[TELEGRAM] Enviando PDF (%d bytes) a chat_id=%r", len(pdf_bytes), chat_id)
-        resp = requests.post(
-            f"https://api.telegram.org/bot{token}/sendDocument",
-            data={
-                'chat_id': chat_id,
-                'caption': f'📄 PDF de la cotización COT{quote.id}',
-            },
-            files={
-                'document': (filename, BytesIO(pdf_bytes), 'application/pdf'),
-            },
-            timeout=10,
-        )
+        with document:
+            size = document.seek(0, os.SEEK_END)
+            document.seek(0)
+            logger.info("[TELEGRAM] Enviando PDF (%d bytes) a chat_id=%r", size, chat_id)
+            resp = session.post(
+                f"{api_base}/sendDocument",
+                data={
+                    'chat_id': chat_id,
+                    'caption': f'📄 PDF de la cotización COT{quote.id}',
+                },
+                files={
+                    'document': (filename, document, 'application/pdf'),
+                },
+                timeout=10,
+            )
         logger.info(
             "[TELEGRAM] PDF status=%s body=%s",
             resp.status_code,
@@ -6855,14 +7413,22 @@ def _normalize_quote_entry(raw) -> dict:
     }
 
 
-def _quote_base_unit_price(product, rental_price_id=None) -> Decimal:
-    """Catalog/list unit price before line discount (supports rental tariffs)."""
+def _quote_base_unit_price(product, rental_price_id=None, tariffs=None) -> Decimal:
+    """
+    Catalog/list unit price before line discount (supports rental tariffs).
+    tariffs: {id: ProductRentalPrice} ya cargado con in_bulk; evita una consulta por línea.
+    """
     if rental_price_id:
-        tariff = ProductRentalPrice.objects.filter(
-            id=rental_price_id,
-            product_id=product.id,
-            is_active=True,
-        ).first()
+        if tariffs is not None:
+            tariff = tariffs.get(rental_price_id)
+            if tariff and (not tariff.is_active or tariff.product_id != product.id):
+                tariff = None
+        else:
+            tariff = ProductRentalPrice.objects.filter(
+                id=rental_price_id,
+                product_id=product.id,
+                is_active=True,
+            ).first()
         if tariff:
             return tariff.price
     return product.selling_price or Decimal('0.00')
@@ -6874,9 +7440,10 @@ def _quote_unit_price(
     rental_price_id=None,
     discount_type='percent',
     discount_percent=None,
+    base_price=None,
 ) -> Decimal:
-    """Unit price after optional line discount (% or fixed amount)."""
-    base = _quote_base_unit_price(product, rental_price_id=rental_price_id)
+    """Unit price after optional line discount (% or fixed amount). base_price evita repetir la búsqueda de tarifa."""
+    base = base_price if base_price is not None else _quote_base_unit_price(product, rental_price_id=rental_price_id)
     # Compat: callers antiguos solo pasan discount_percent
     if discount_percent is not None and (discount_value is None or discount_value == 0):
         discount_value = discount_percent
@@ -6918,83 +7485,106 @@ def _get_quote_session(request) -> dict:
         else:
             line_key = str(product_id)
         clean[line_key] = entry
-    request.session['quotation'] = clean
-    request.session.modified = True
+    # Solo reescribir la sesión si la limpieza cambió algo (evita un guardado por cada AJAX)
+    if clean != data:
+        request.session['quotation'] = clean
+        request.session.modified = True
     return clean
 
 
+def _quote_catalog_entries(product_ids) -> dict:
+    """
+    {product_id: datos de catálogo} para el payload de la cotización: nombre, categoría, imagen,
+    precios y tarifas activas {id: (precio, periodo)}. Se cachea por versión de catálogo, así que
+    cada cambio de cantidad o descuento recalcula la hoja sin volver a consultar productos ni tarifas.
+    """
+    if not product_ids:
+        return {}
+    version = catalog_cache_version()
+    keys = {pid: f'quote:catalog_entry:v{version}:{pid}' for pid in product_ids}
+    cached = cache.get_many(list(keys.values()))
+    entries = {pid: cached[key] for pid, key in keys.items() if key in cached}
+    missing = [pid for pid in product_ids if pid not in entries]
+    if missing:
+        products = (
+            Product.objects.filter(id__in=missing)
+            .select_related('category')
+            .only('id', 'name', 'image', 'price', 'promotional_price', 'category__name')
+            .prefetch_related(Prefetch(
+                'rental_prices',
+                queryset=ProductRentalPrice.objects.filter(is_active=True).only(
+                    'id', 'product_id', 'period_type', 'price',
+                ),
+                to_attr='active_rental_prices',
+            ))
+        )
+        fresh = {
+            p.id: {
+                'name': p.name,
+                'category': p.category.name,
+                'image_url': p.image.url if p.image else '',
+                'price': p.price,
+                'selling_price': p.selling_price or _ZERO,
+                'tariffs': {t.id: (t.price, t.get_period_type_display()) for t in p.active_rental_prices},
+            }
+            for p in products
+        }
+        cache.set_many({keys[pid]: entry for pid, entry in fresh.items()}, 300)
+        entries.update(fresh)
+    return entries
+
+
 def _quote_payload(request) -> dict:
     """Build JSON payload for current quotation session."""
     q = _get_quote_session(request)
     product_ids = set()
-    rental_ids = set()
-    for key, entry in q.items():
-        pid, rid = _parse_quote_line_key(key)
-        if pid is None:
-            continue
-        product_ids.add(pid)
-        rid = entry.get('rental_price_id') or rid
-        if rid:
-            rental_ids.add(rid)
-
-    products = Product.objects.filter(id__in=product_ids).select_related('category')
-    by_id = {p.id: p for p in products}
-    tariffs = {
-        t.id: t
-        for t in ProductRentalPrice.objects.filter(id__in=rental_ids, is_active=True).select_related('product')
-    }
+    for key in q:
+        pid, _ = _parse_quote_line_key(key)
+        if pid is not None:
+            product_ids.add(pid)
+    catalog = _quote_catalog_entries(product_ids)
 
     items = []
-    total = Decimal('0.00')
-    total_base = Decimal('0.00')
-    total_iva = Decimal('0.00')
-
-    def split_iva(amount: Decimal):
-        if amount is None:
-            amount = Decimal('0.00')
-        base = (amount / (Decimal('1.00') + IVA_RATE))
-        iva = amount - base
-        return base, iva
+    total = _ZERO
 
     for line_key, entry in q.items():
         pid, rid_from_key = _parse_quote_line_key(line_key)
-        p = by_id.get(pid)
+        p = catalog.get(pid)
         if not p:
             continue
         qty = entry['qty']
         discount_type = entry.get('discount_type') or 'percent'
         discount_value = entry.get('discount_value', entry.get('discount_percent', 0))
         rental_price_id = entry.get('rental_price_id') or rid_from_key
-        tariff = tariffs.get(rental_price_id) if rental_price_id else None
+        tariff = p['tariffs'].get(rental_price_id) if rental_price_id else None
 
-        list_unit = _quote_base_unit_price(p, rental_price_id=rental_price_id)
+        # Precio de lista desde las tarifas ya cargadas (sin una consulta por línea de alquiler)
+        list_unit = tariff[0] if tariff else p['selling_price']
         unit = _quote_unit_price(
-            p,
+            None,
             discount_value=discount_value,
             discount_type=discount_type,
             rental_price_id=rental_price_id,
+            base_price=list_unit,
         )
+        # Una sola pasada por línea: montos, IVA y descuento calculados en línea
         subtotal = unit * qty
         total += subtotal
-        base_subtotal, iva_subtotal = split_iva(subtotal)
-        base_unit, iva_unit = split_iva(unit)
-        total_base += base_subtotal
-        total_iva += iva_subtotal
-
-        discount_unit = (list_unit - unit) if unit < list_unit else Decimal('0.00')
-        discount_total = discount_unit * qty
-        display_name = p.name
+        base_unit = unit / _IVA_DIVISOR
+        base_subtotal = subtotal / _IVA_DIVISOR
+        discount_unit = (list_unit - unit) if unit < list_unit else _ZERO
+        display_name = p['name']
         period_label = ''
         if tariff:
-            period_label = tariff.get_period_type_display()
-            display_name = f'{p.name} · {period_label}'
+            period_label = tariff[1]
+            display_name = f"{p['name']} · {period_label}"
 
         items.append({
-            'id': p.id,
+            'id': pid,
             'line_key': line_key,
             'name': display_name,
-            'category': p.category.name,
-            'image_url': p.image.url if p.image else '',
+            'category': p['category'],
+            'image_url': p['image_url'],
             'qty': qty,
             'discount_type': discount_type,
             'discount_value': float(discount_value),
@@ -7004,48 +7594,61 @@ def _quote_payload(request) -> dict:
             'list_unit_price': float(list_unit),
             'unit_price': float(unit),
             'unit_base': float(base_unit),
-            'unit_iva': float(iva_unit),
-            'original_unit_price': float(p.price),
+            'unit_iva': float(unit - base_unit),
+            'original_unit_price': float(p['price']),
             'discount_unit': float(discount_unit),
-            'discount_total': float(discount_total),
+            'discount_total': float(discount_unit * qty),
             'subtotal': float(subtotal),
             'subtotal_base': float(base_subtotal),
-            'subtotal_iva': float(iva_subtotal),
+            'subtotal_iva': float(subtotal - base_subtotal),
         })
+    # La base total sale del total (la división es lineal): sin acumuladores por línea
+    total_base = total / _IVA_DIVISOR
     return {
         'items': items,
         'total': float(total),
         'total_base': float(total_base),
-        'total_iva': float(total_iva),
+        'total_iva': float(total - total_base),
     }
 
 
+def _quote_json_response(payload: dict) -> JsonResponse:
+    """Respuesta JSON compacta (sin espacios) para los endpoints AJAX de la cotización."""
+    return JsonResponse(payload, json_dumps_params={'separators': (',', ':')})
+
+
 def quotation_ajax_add(request):
     if request.method != 'POST':
         return JsonResponse({'error': 'Method not allowed'}, status=405)
     q = _get_quote_session(request)
     ids = request.POST.getlist('products[]') or request.POST.getlist('products') or []
-    added = 0
+    parsed = []
     for raw in ids:
         raw = str(raw).strip()
         if not raw:
             continue
         product_id, rental_price_id = _parse_quote_line_key(raw)
-        if product_id is None:
-            continue
-        if not Product.objects.filter(id=product_id, available=True).exists():
+        if product_id is not None:
+            parsed.append((product_id, rental_price_id))
+    # Productos y tarifas válidos en una consulta cada uno (no una por id enviado)
+    products = Product.objects.filter(available=True).only('id', 'product_type').in_bulk(
+        {pid for pid, _ in parsed}
+    )
+    rental_ids = {rid for _, rid in parsed if rid}
+    valid_tariffs = set(
+        ProductRentalPrice.objects.filter(id__in=rental_ids, is_active=True).values_list('id', 'product_id')
+    ) if rental_ids else set()
+    added = 0
+    for product_id, rental_price_id in parsed:
+        prod = products.get(product_id)
+        if not prod:
             continue
         if rental_price_id:
-            if not ProductRentalPrice.objects.filter(
-                id=rental_price_id, product_id=product_id, is_active=True
-            ).exists():
+            if (rental_price_id, product_id) not in valid_tariffs:
                 continue
             key = f'{product_id}:{rental_price_id}'
         else:
             # Alquileres deben agregarse por tarifa (hora/día/semana/mes)
-            prod = Product.objects.filter(id=product_id, available=True).only('id', 'product_type').first()
-            if not prod:
-                continue
             if prod.is_rental:
                 continue
             key = str(product_id)
@@ -7059,11 +7662,12 @@ def quotation_ajax_add(request):
                 'rental_price_id': rental_price_id,
             }
             added += 1
-    request.session['quotation'] = q
-    request.session.modified = True
+    if added:
+        request.session['quotation'] = q
+        request.session.modified = True
     payload = _quote_payload(request)
     payload['added'] = added
-    return JsonResponse(payload)
+    return _quote_json_response(payload)
 
 
 def quotation_ajax_remove(request):
@@ -7074,14 +7678,15 @@ def quotation_ajax_remove(request):
     if not line_key:
         return JsonResponse({'error': 'Invalid product_id'}, status=400)
     # Compat: si llega solo product_id numérico, borra esa clave
-    q.pop(line_key, None)
+    removed = q.pop(line_key, None) is not None
     # También limpia claves legacy del producto sin tarifa
     pid, _ = _parse_quote_line_key(line_key)
     if pid is not None and ':' not in line_key:
-        q.pop(str(pid), None)
-    request.session['quotation'] = q
-    request.session.modified = True
-    return JsonResponse(_quote_payload(request))
+        removed = q.pop(str(pid), None) is not None or removed
+    if removed:
+        request.session['quotation'] = q
+        request.session.modified = True
+    return _quote_json_response(_quote_payload(request))
 
 
 def quotation_ajax_update_qty(request):
@@ -7102,7 +7707,7 @@ def quotation_ajax_update_qty(request):
         q[line_key] = entry
         request.session['quotation'] = q
         request.session.modified = True
-    return JsonResponse(_quote_payload(request))
+    return _quote_json_response(_quote_payload(request))
 
 
 def quotation_ajax_update_discount(request):
@@ -7141,7 +7746,7 @@ def quotation_ajax_update_discount(request):
         q[line_key] = entry
         request.session['quotation'] = q
         request.session.modified = True
-    return JsonResponse(_quote_payload(request))
+    return _quote_json_response(_quote_payload(request))
 
 
 # --- Calculadora de dilución con agua ---
@@ -7316,9 +7921,7 @@ def _drinzz_contract_additional_paragraphs(contract: DrinzzContractConfig):
 def _build_drinzz_contract_pdf_bytes(contract=None):
     """Genera PDF del contrato marco Drinzz."""
     try:
-        from django.template.loader import get_template
         from xhtml2pdf import pisa
-        from io import BytesIO
     except ImportError:
         return None, 'xhtml2pdf no está instalado'
 